@@ -1,16 +1,22 @@
-import datetime
-import random
 import statistics
 import time
 import streamlit as st
-import matplotlib.pyplot as plt
 import pandas as pd
 from supabase import create_client, Client
  
 from constants import *
 from auth_manager import AuthManager
 from data_manager_supabase import DataManagerSupabase
+from cached_data_manager import CachedDataManager
+from change_notifier import ChangeNotifier, RealtimeChangeListener
 from habit_tracker import HabitTracker
+from rerun_profiler import PROFILE_QUERY_PARAM, should_profile_rerun, profile_rerun
+from history_stats import build_calendar_heatmap
+from charts import build_progress_figure, progress_dataframe
+from memory_guard import session_memory_report
+from notification_dispatcher import NotificationDispatcher, RateLimiter, SupabaseDedupStore
+from due_index import DueIndex
+from http_metrics import PayloadMetrics, instrument_postgrest
 
 # ------------------------------
 # LINE通知関数
@@ -63,8 +69,12 @@ def send_line_notification_to_user(supabase: Client, message: str, user_id: str)
 # LINE設定UI
 # ------------------------------
 
+@st.fragment
 def render_line_settings(user_id, supabase):
-    """LINE通知設定UI（個人利用・登録済み前提）"""
+    """LINE通知設定UI（個人利用・登録済み前提）
+
+    フラグメントなので、トグル操作時はこの部分だけが再実行される。
+    """
     
     try:
         result = (
@@ -95,11 +105,9 @@ def render_line_settings(user_id, supabase):
         try:
             supabase.table("user_line_settings").update({
                 "notification_enabled": enabled
-            }).eq("user_id", user_id).execute()
+            }, returning="minimal").eq("user_id", user_id).execute()
 
             st.success("設定を更新しました")
-            time.sleep(0.5)
-            st.rerun()
 
         except Exception as e:
             st.error(f"更新エラー: {e}")
@@ -157,9 +165,58 @@ except Exception as e:
     st.error(f"Supabaseに接続できません: {e}")
     st.stop()
  
+@st.cache_resource
+def get_due_index() -> DueIndex:
+    """全セッションで共有する「今日の記録が必要なユーザー」索引（起動時に一括構築）"""
+    index = DueIndex()
+    service_key = st.secrets.get("SUPABASE_SERVICE_KEY")
+    if service_key:
+        service_client = create_client(st.secrets["SUPABASE_URL"], service_key)
+        index.rebuild(DataManagerSupabase(service_client).load_due_snapshot())
+    return index
+
+@st.cache_resource
+def get_change_notifier() -> ChangeNotifier:
+    """全セッションで共有する変更通知（別プロセスの変更は Realtime で受け取る）
+
+    SUPABASE_SERVICE_KEY がない場合は Realtime を使わないため、このプロセス内の
+    書き込みしか検知できない（別プロセス・別サーバーからの変更はキャッシュにも
+    DueIndex にも反映されない。索引が古くてもリセットの前には最新のログで確認する）。
+    """
+    notifier = ChangeNotifier()
+    service_key = st.secrets.get("SUPABASE_SERVICE_KEY")
+    if service_key:
+        RealtimeChangeListener(notifier, st.secrets["SUPABASE_URL"], service_key, get_due_index()).start()
+    else:
+        print("SUPABASE_SERVICE_KEY is not set: changes from other processes will not invalidate caches")
+    return notifier
+
+due_index = get_due_index()
+notifier = get_change_notifier()
+
+if "dm_cache" not in st.session_state:
+    st.session_state.dm_cache = {}
+
+@st.cache_resource
+def get_payload_metrics() -> PayloadMetrics:
+    """全セッションで共有するクエリごとのレスポンスサイズの集計"""
+    return PayloadMetrics()
+
 auth = AuthManager(supabase)
-dm = DataManagerSupabase(supabase)
-tracker = HabitTracker(dm)
+instrument_postgrest(supabase, get_payload_metrics())
+dm = CachedDataManager(DataManagerSupabase(supabase, notifier, due_index), notifier, st.session_state.dm_cache)
+tracker = HabitTracker(dm, due_index=due_index)
+
+@st.cache_resource
+def get_notification_rate_limiter() -> RateLimiter:
+    """全セッションで共有する通知のレート制限"""
+    return RateLimiter(NOTIFICATION_RATE_LIMIT, NOTIFICATION_RATE_WINDOW_SECONDS)
+
+notifications = NotificationDispatcher(
+    SupabaseDedupStore(supabase),
+    lambda message, user_id: send_line_notification_to_user(supabase, message, user_id),
+    get_notification_rate_limiter(),
+)
  
 # ------------------------------
 # Auth UI
@@ -241,9 +298,7 @@ def render_progress_chart(logs, max_days=30):
         st.info("📊 まだ記録がありません。最初の一歩を踏み出しましょう！")
         return
  
-    df = pd.DataFrame(logs)
-    df["log_date"] = pd.to_datetime(df["log_date"])
-    df = df.sort_values(by="log_date").tail(max_days)
+    df = progress_dataframe(logs, max_days)
     
     # 平均時間を計算
     avg_hour = statistics.mean(df["completion_hour"])
@@ -254,33 +309,33 @@ def render_progress_chart(logs, max_days=30):
     with col2:
         st.metric("📅 記録日数", f"{len(df)}日", help="これまでに記録した日数")
    
-    fig, ax = plt.subplots(figsize=(10, 5))
-    
-    # 達成回数を計算
-    df['count'] = range(1, len(df) + 1)
-    
-    ax.plot(df["count"], df["completion_hour"], 
-            marker="o", linestyle="-", color="#ff4b4b", 
-            linewidth=2.5, markersize=8)
-   
-    ax.set_ylim(-1, 24)
-    ax.set_xlim(1, 30)
-    
-    ax.set_yticks(range(0, 24, 2))
-    ax.set_xticks(range(1, 31))
-    
-    ax.set_ylabel("click_hour", fontsize=12, fontweight='bold')
-    ax.set_xlabel("click_count", fontsize=12, fontweight='bold')
-    
-    ax.grid(True, linestyle='--', alpha=0.6)
-    ax.set_title("Achievement time per click", fontsize=14, fontweight='bold', pad=20)
+    fig = build_progress_figure(df)
+    try:
+        st.pyplot(fig)
+    finally:
+        # 描画後はすぐに図を破棄する
+        fig.clear()
+
+def render_history_heatmap(history):
+    """全履歴の達成日と達成時刻をカレンダーヒートマップで表示する"""
+    heatmap = build_calendar_heatmap(history)
+    if not heatmap["date"]:
+        return
     
-    # 背景色を設定
-    ax.set_facecolor('#fafafa')
-    fig.patch.set_facecolor('white')
- 
-    plt.tight_layout()
-    st.pyplot(fig)
+    # 記録のあるマスだけを列ごとの配列でブラウザに送り、描画はブラウザ側で行う
+    st.vega_lite_chart(
+        {"date": heatmap["date"], "hour": heatmap["hour"], "count": heatmap["count"]},
+        {
+            "mark": {"type": "rect", "tooltip": True},
+            "encoding": {
+                "x": {"field": "date", "type": "temporal", "timeUnit": "yearmonthdate", "title": "達成日"},
+                "y": {"field": "hour", "type": "ordinal", "title": "達成時刻", "sort": "descending"},
+                "color": {"field": "count", "type": "quantitative", "title": "回数", "scale": {"scheme": "reds"}},
+            },
+            "height": 300,
+        },
+        use_container_width=True,
+    )
 
 # ------------------------------
 # Pages
@@ -318,7 +373,7 @@ def render_settings(user_id):
     habit = dm.load_user_habit(user_id)
     name = st.text_input(
         "習慣の内容", 
-        value=habit.get("name", "") if habit else "", 
+        value=habit.name if habit else "", 
         placeholder="例: 朝5分ストレッチをする",
         help="できるだけシンプルで具体的に！"
     )
@@ -351,13 +406,7 @@ def render_settings(user_id):
         - ☀️ 起きてすぐ
         """)
     
-    t = TIME_INPUT_DEFAULT
-    if habit and habit.get("target_time"):
-        try:
-            h, m = map(int, habit["target_time"].split(":"))
-            t = datetime.time(h, m)
-        except ValueError:
-            t = TIME_INPUT_DEFAULT
+    t = habit.target_time if habit else TIME_INPUT_DEFAULT
     
     time_input = st.time_input(
         '目標時刻', 
@@ -382,21 +431,15 @@ def render_settings(user_id):
         with col2:
             if st.button('🚀 この習慣で30日チャレンジを開始！', use_container_width=True, type="primary"):
                 try:
-                    result = supabase.table("habits").upsert({
-                        "user_id": user_id,
-                        "name": name,
-                        "target_time": time_input.strftime("%H:%M"),
-                        "active": True
-                    }, on_conflict="user_id").execute()
-                    
-                    if result and result.data:
+                    if dm.save_user_habit(user_id, name, time_input.strftime("%H:%M")):
                         st.success("✅ 習慣を設定しました！さあ、始めましょう！")
                         
                         # LINE通知を送信
-                        send_line_notification_to_user(
-                            supabase,
-                            f"🎯 新しい習慣をスタート！\n「{name}」\n目標時刻: {time_input.strftime('%H:%M')}\n\n30日間頑張りましょう！",
-                            user_id
+                        notifications.dispatch(
+                            user_id,
+                            name,
+                            "start",
+                            f"🎯 新しい習慣をスタート！\n「{name}」\n目標時刻: {time_input.strftime('%H:%M')}\n\n30日間頑張りましょう！"
                         )
                         
                         st.session_state.page = "challenge"
@@ -412,7 +455,7 @@ def render_challenge(user_id):
     """習慣に挑戦し、進捗を記録するページ（改善版）"""
     habit = dm.load_user_habit(user_id)
     
-    if not habit or not habit.get("name"):
+    if not habit or not habit.name:
         st.warning("まず習慣を設定してください")
         if st.button("習慣を設定する", use_container_width=True):
             st.session_state.page = "settings"
@@ -420,34 +463,41 @@ def render_challenge(user_id):
         return
     
     # ヘッダー
-    st.markdown(f"<h1 style='text-align: center;'>🎯 {habit['name']}</h1>", unsafe_allow_html=True)
+    st.markdown(f"<h1 style='text-align: center;'>🎯 {habit.name}</h1>", unsafe_allow_html=True)
     
     st.write("")
     
-    logs = tracker.get_logs(user_id)
-    count, last_date = tracker.get_click_status(logs)
+    render_challenge_progress(user_id, habit)
+
+@st.fragment
+def render_challenge_progress(user_id, habit):
+    """進捗の表示と記録ボタン
+
+    フラグメントなので、記録・取り消し時はこの部分だけが再実行される。
+    """
+    # 最終記録日は索引から取得し、索引にない場合だけ直近のログを取得する
+    count, last_date, logs = tracker.get_challenge_status(user_id)
+    can_click = tracker.user_can_click_today(user_id, last_date)
     
     # 2日以上記録がない場合のリセット判定
-    if last_date:
-        last_date_obj = datetime.datetime.strptime(last_date, DATE_FORMAT).date()
-        days_since_last = (datetime.date.today() - last_date_obj).days
+    if tracker.user_needs_reset(user_id, count, last_date):
+        st.error(f'😢 {MISS_DAYS_THRESHOLD}日以上記録がなかったため、連続日数をリセットしました')
+        st.info("💪 大丈夫！また今日から始めましょう！")
         
-        if days_since_last > MISS_DAYS_THRESHOLD and count > 0:
-            st.error(f'😢 {MISS_DAYS_THRESHOLD}日以上記録がなかったため、連続日数をリセットしました')
-            st.info("💪 大丈夫！また今日から始めましょう！")
-            
-            # LINE通知を送信
-            send_line_notification_to_user(
-                supabase,
-                f"⚠️ 習慣がリセットされました\n「{habit['name']}」\n\n{MISS_DAYS_THRESHOLD}日間記録がなかったため、連続日数がリセットされました。\n\nまた今日から頑張りましょう！💪",
-                user_id
-            )
-            
-            tracker.reset_logs(user_id)
-            count = 0
-            last_date = None
-            time.sleep(2)
-            st.rerun()
+        # LINE通知を送信
+        notifications.dispatch(
+            user_id,
+            habit.name,
+            "reset",
+            f"⚠️ 習慣がリセットされました\n「{habit.name}」\n\n{MISS_DAYS_THRESHOLD}日間記録がなかったため、連続日数がリセットされました。\n\nまた今日から頑張りましょう！💪"
+        )
+        
+        tracker.reset_logs(user_id)
+        mark_changes_seen(user_id)
+        # リセット後の状態でそのまま描画を続ける
+        count = 0
+        last_date = None
+        can_click = True
     
     # Session Stateの初期化
     if 'cheers_message' not in st.session_state:
@@ -471,11 +521,11 @@ def render_challenge(user_id):
         st.metric(
             "🔥 連続記録", 
             f"{count}日",
-            delta=None if count == 0 else "+1" if tracker.can_click_today(last_date) else "達成済"
+            delta=None if count == 0 else "+1" if can_click else "達成済"
         )
     
     with col2:
-        display_date = last_date if last_date else "---"
+        display_date = last_date.strftime(DATE_FORMAT) if last_date else "---"
         st.metric("📅 最終記録日", display_date)
     
     with col3:
@@ -489,6 +539,7 @@ def render_challenge(user_id):
     # マイルストーンメッセージ
     if st.session_state.milestone_message:
         icon, title, msg = st.session_state.milestone_message
+        st.balloons()
         st.markdown(f"""
         <div style='text-align: center; padding: 2rem; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
                     border-radius: 15px; color: white; margin: 2rem 0;'>
@@ -506,10 +557,11 @@ def render_challenge(user_id):
             st.session_state.balloons_triggered = True
             
             # 30日達成のLINE通知
-            send_line_notification_to_user(
-                supabase,
-                f"🏆 30日完全達成おめでとう！🏆\n\n「{habit['name']}」を30日間継続しました！\n\nあなたは素晴らしい！次の習慣にもチャレンジしましょう！",
-                user_id
+            notifications.dispatch(
+                user_id,
+                habit.name,
+                "complete",
+                f"🏆 30日完全達成おめでとう！🏆\n\n「{habit.name}」を30日間継続しました！\n\nあなたは素晴らしい！次の習慣にもチャレンジしましょう！"
             )
         
         st.markdown("""
@@ -527,52 +579,70 @@ def render_challenge(user_id):
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
             if st.button("🎉 次の習慣にチャレンジする", use_container_width=True, type="primary"):
-                tracker.archive(user_id, habit["name"], habit["target_time"])
-                tracker.reset_logs(user_id)
-                dm.delete_user_habit(user_id)
-                st.session_state.page = "settings"
-                st.session_state.balloons_triggered = False
-                st.rerun()
+                if tracker.complete_challenge(user_id, habit.name, habit.target_time, logs):
+                    st.session_state.page = "settings"
+                    st.session_state.balloons_triggered = False
+                    st.rerun()
+                else:
+                    st.error("チャレンジの完了処理に失敗しました")
     
     # 記録ボタン
-    elif tracker.can_click_today(last_date):
+    elif can_click:
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            if st.button(" 今日の習慣を記録する", use_container_width=True, type="primary", help="クリックして今日の達成を記録！"):
-                tracker.record_today(user_id)
-                
-                # 新しいカウント
-                new_count = count + 1
-                
-                # マイルストーンチェック
-                milestone = check_milestone(new_count)
-                if milestone:
-                    icon, title, msg = milestone
-                    st.session_state.milestone_message = milestone
-                    st.balloons()
-                    
-                    # マイルストーン達成のLINE通知
-                    send_line_notification_to_user(
-                        supabase,
-                        f"{icon} {title}\n\n「{habit['name']}」\n{new_count}日連続達成！\n\n{msg}",
-                        user_id
-                    )
-                    
-                st.rerun()
+            # 書き込みはコールバックで行い、フラグメントの再実行時に最新の状態を描画する
+            st.button(
+                " 今日の習慣を記録する",
+                use_container_width=True,
+                type="primary",
+                help="クリックして今日の達成を記録！",
+                on_click=record_today_clicked,
+                args=(user_id, habit, count),
+            )
     else:
         st.info("また明日も頑張りましょう！！！")
         
         # 取り消しボタン
         st.write("")
-        if st.button("🔄 直前の記録を取り消す"):
-                if count > 0:
-                    tracker.delete_today_log(user_id)
-                    st.success("記録を取り消しました。再度記録できます")
-                    st.session_state.cheers_message = None
-                    time.sleep(1)
-                    st.rerun()
-                else:
-                    st.error("取り消す記録がありません")
+        st.button("🔄 直前の記録を取り消す", on_click=delete_today_clicked, args=(user_id, count))
+    
+    # 取り消し結果のメッセージ
+    if st.session_state.get("undo_message"):
+        kind, text = st.session_state.undo_message
+        getattr(st, kind)(text)
+        st.session_state.undo_message = None
+
+def record_today_clicked(user_id, habit, count):
+    """記録ボタンのコールバック"""
+    tracker.record_today(user_id)
+    mark_changes_seen(user_id)
+    
+    # 新しいカウント
+    new_count = count + 1
+    
+    # マイルストーンチェック
+    milestone = check_milestone(new_count)
+    if milestone:
+        icon, title, msg = milestone
+        st.session_state.milestone_message = milestone
+        
+        # マイルストーン達成のLINE通知
+        notifications.dispatch(
+            user_id,
+            habit.name,
+            f"milestone_{new_count}",
+            f"{icon} {title}\n\n「{habit.name}」\n{new_count}日連続達成！\n\n{msg}"
+        )
+
+def delete_today_clicked(user_id, count):
+    """取り消しボタンのコールバック"""
+    if count > 0:
+        tracker.delete_today_log(user_id)
+        mark_changes_seen(user_id)
+        st.session_state.undo_message = ("success", "記録を取り消しました。再度記録できます")
+        st.session_state.cheers_message = None
+    else:
+        st.session_state.undo_message = ("error", "取り消す記録がありません")
      
 def render_history(user_id):
     """過去の習慣の達成履歴を表示するページ"""
@@ -582,27 +652,65 @@ def render_history(user_id):
     st.write("")
     st.write("")
     
-    history = dm.load_history(user_id)
+    summary = dm.load_history_summary(user_id)
    
-    if not history:
+    if not summary.total_habits:
         st.info("📝 まだ完了した習慣の履歴はありません")
         st.write("30日間習慣を継続すると、ここに記録されます！")
         return
     
     # 達成数の表示
-    st.metric("🎯 達成した習慣の数", f"{len(history)}個")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("🎯 達成した習慣の数", f"{summary.total_habits}個")
+    with col2:
+        st.metric("📅 累計達成日数", f"{summary.total_days}日")
+    with col3:
+        st.metric("🔥 最長連続記録", f"{summary.best_streak}日")
+    
+    st.caption("⏰ 習慣ごとの平均達成時刻")
+    st.bar_chart(pd.DataFrame({"習慣の数": list(summary.hour_histogram)}, index=range(HOURS_PER_DAY)))
+    st.write("")
+    
+    history = dm.load_history(user_id)
+    
+    st.markdown("### 🗓️ 達成カレンダー")
+    render_history_heatmap(history)
     st.write("")
        
     for i, r in enumerate(history, 1):
-        archive_date = datetime.datetime.fromisoformat(r["archived_at"]).strftime("%Y年%m月%d日")
-        log_summary = r.get("log_summary", [])
-       
-        with st.expander(f'🏅 {i}. {r["habit_name"]} - {archive_date} ({r["total_days"]}日達成)'):
-            st.markdown(f'**⏰ 目標時間:** {r["target_time"]}')
-            st.markdown(f'**📅 達成日:** {archive_date}')
-            st.write("")
-            render_progress_chart(log_summary, r["total_days"])
+        render_history_entry(i, r)
+
+@st.fragment
+def render_history_entry(i, r):
+    """履歴1件分の表示
+
+    グラフは表示を選んだ履歴だけ描画し、切り替え時はこの部分だけが再実行される。
+    """
+    archive_date = r.archived_at.strftime("%Y年%m月%d日")
+   
+    with st.expander(f'🏅 {i}. {r.habit_name} - {archive_date} ({r.total_days}日達成)'):
+        st.markdown(f'**⏰ 目標時間:** {r.target_time.strftime("%H:%M")}')
+        st.markdown(f'**📅 達成日:** {archive_date}')
+        st.write("")
+        if st.toggle("📈 グラフを表示", key=f"history_chart_{r.id or i}"):
+            render_progress_chart(r.log_summary, r.total_days)
  
+# ------------------------------
+# 変更監視
+# ------------------------------
+
+@st.fragment(run_every=CHANGE_WATCH_INTERVAL_SECONDS)
+def render_change_watcher(user_id):
+    """他のタブ・端末での変更を検知したら画面全体を再描画する"""
+    # seen_change_version は画面全体の再描画のたびに main() で更新される
+    if st.session_state.get("seen_change_version") != notifier.version(user_id):
+        st.rerun(scope="app")
+
+def mark_changes_seen(user_id):
+    """自分の書き込みによる変更を既読にする（フラグメント内の書き込み後に呼ぶ）"""
+    st.session_state.seen_change_version = notifier.version(user_id)
+
 # ------------------------------
 # Main
 # ------------------------------
@@ -619,15 +727,18 @@ def main():
     if session and session.access_token:
         supabase.postgrest.auth(session.access_token)
  
+    st.session_state.seen_change_version = notifier.version(user_id)
+    render_change_watcher(user_id)
+ 
     if "page" not in st.session_state:
         habit = dm.load_user_habit(user_id)
-        if not habit or not habit.get("name"):
+        if not habit or not habit.name:
             st.session_state.page = "settings"
         else:
             st.session_state.page = "challenge"
     
     habit = dm.load_user_habit(user_id)
-    has_active_habit = habit and habit.get("name")
+    has_active_habit = habit and habit.name
  
     if has_active_habit:
         st.sidebar.title("メニュー")
@@ -673,8 +784,8 @@ def main():
         
         # 現在の習慣情報
         st.sidebar.markdown("### 現在の習慣")
-        st.sidebar.write(f"{habit['name']}")
-        st.sidebar.write(f"開始時刻 {habit['target_time']}")
+        st.sidebar.write(f"{habit.name}")
+        st.sidebar.write(f"開始時刻 {habit.target_time.strftime('%H:%M')}")
         
         st.sidebar.markdown("---")
         
@@ -697,4 +808,20 @@ def main():
         render_history(user_id)
    
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if should_profile_rerun(st.query_params, auth.get_user()):
+        # ?profile=1 は1回のリランだけに効かせる（main() が st.rerun() で抜けても残らないよう先に消す）
+        st.query_params.pop(PROFILE_QUERY_PARAM, None)
+        result = profile_rerun(main, PROFILE_OUTPUT_DIR, keep=PROFILE_MAX_FILES)
+        with st.sidebar.expander("⏱️ プロファイル結果"):
+            st.write(f"合計: {result['elapsed']:.3f}秒")
+            st.json(result["categories"])
+            st.caption(result["path"])
+        with st.sidebar.expander("🧠 セッションのメモリ使用量"):
+            memory = session_memory_report(st.session_state)
+            st.write(f"合計: {memory['total_bytes'] / 1024:.1f} KB")
+            st.write(f"データキャッシュ: {memory['dm_cache_entries']}件 / {memory['dm_cache_bytes'] / 1024:.1f} KB")
+            st.json(memory["keys"])
+        with st.sidebar.expander("📦 クエリごとの転送量"):
+            st.dataframe(pd.DataFrame(get_payload_metrics().snapshot()), hide_index=True)
+    else:
+        main()
\ No newline at end of file
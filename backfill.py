@@ -0,0 +1,252 @@
+"""progress_logs の一括取り込み
+
+他アプリからの移行やサポートによるデータ修正のために、多数の記録を
+まとめて検証・重複排除し、チャンク単位で upsert する。
+
+    python backfill.py logs.csv --chunk-size 500 --workers 4
+
+CSV は user_id,log_date,completion_hour のヘッダー付き。
+接続には環境変数 SUPABASE_URL と SUPABASE_SERVICE_KEY を使う。
+
+progress_logs には「今続いているチャレンジ」の記録だけを置く
+（アプリは記録が MISS_DAYS_THRESHOLD 日を超えて途切れるとログを消す）。
+そのため既存のログと取り込む行を合わせてユーザーごとの連続記録
+（最新の MAX_CHALLENGE_DAYS 日分）を求め、それに含まれない取り込み行は
+取り込まずに報告し、含まれない既存のログは削除して報告する。
+最後にログを読み直し、連続記録になっていないユーザーがいれば報告する。
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+import uuid
+from collections.abc import Mapping
+
+from constants import DATE_FORMAT, MAX_CHALLENGE_DAYS, MISS_DAYS_THRESHOLD
+
+
+class BackfillError(ValueError):
+    """取り込みデータの検証エラー"""
+
+
+def _row_fields(row) -> tuple:
+    """dict または (user_id, log_date, completion_hour) の並びから3つの値を取り出す"""
+    if isinstance(row, Mapping):
+        return row.get("user_id"), row.get("log_date"), row.get("completion_hour")
+    try:
+        user_id, log_date, hour = row
+    except (TypeError, ValueError):
+        raise BackfillError(f"行は (user_id, log_date, completion_hour) で指定してください: {row!r}")
+    return user_id, log_date, hour
+
+
+def validate_row(row) -> dict:
+    """1行（dict または3要素の並び）を検証し、upsert 用の dict に正規化する"""
+    user_id, log_date, hour = _row_fields(row)
+
+    user_id = str(user_id or "").strip()
+    if not user_id:
+        raise BackfillError("user_id がありません")
+    try:
+        user_id = str(uuid.UUID(user_id))
+    except ValueError:
+        raise BackfillError(f"user_id が UUID ではありません: {user_id!r}")
+
+    if not isinstance(log_date, datetime.date):
+        try:
+            log_date = datetime.datetime.strptime(str(log_date).strip(), DATE_FORMAT).date()
+        except ValueError:
+            raise BackfillError(f"log_date が不正です: {log_date!r}")
+    if log_date > datetime.date.today():
+        raise BackfillError(f"log_date が未来の日付です: {log_date}")
+
+    try:
+        hour = int(hour)
+    except (TypeError, ValueError):
+        raise BackfillError(f"completion_hour が不正です: {hour!r}")
+    if not 0 <= hour <= 23:
+        raise BackfillError(f"completion_hour は0〜23で指定してください: {hour}")
+
+    return {
+        "user_id": user_id,
+        "log_date": log_date.strftime(DATE_FORMAT),
+        "completion_hour": hour,
+    }
+
+
+def prepare_rows(rows, first_line: int = 1) -> tuple:
+    """行を検証し、(user_id, log_date) で重複排除する（後の行を優先）
+
+    first_line は最初の行の行番号（ヘッダー付きの CSV なら 2）。
+    ([(行番号, 取り込む行), ...], [(行番号, エラー内容), ...]) を返す。
+    """
+    unique = {}
+    errors = []
+    for line_no, row in enumerate(rows, first_line):
+        try:
+            valid = validate_row(row)
+        except BackfillError as e:
+            errors.append((line_no, str(e)))
+            continue
+        unique[(valid["user_id"], valid["log_date"])] = (line_no, valid)
+
+    return list(unique.values()), errors
+
+
+def current_streak(dates, today: datetime.date) -> set:
+    """記録日の集合のうち、今続いているチャレンジに数えられる日付を返す
+
+    HabitTracker.needs_reset と同じく、MISS_DAYS_THRESHOLD 日を超える空白で
+    連続記録は途切れる。最新の記録がすでに途切れていれば空集合を返す。
+    """
+    ordered = sorted(dates, reverse=True)
+    if not ordered or (today - ordered[0]).days > MISS_DAYS_THRESHOLD:
+        return set()
+
+    streak = [ordered[0]]
+    for day in ordered[1:]:
+        if len(streak) >= MAX_CHALLENGE_DAYS or (streak[-1] - day).days > MISS_DAYS_THRESHOLD:
+            break
+        streak.append(day)
+    return set(streak)
+
+
+def plan_backfill(prepared: list, existing: dict, today: datetime.date) -> dict:
+    """既存のログと合わせてユーザーごとの連続記録を求め、取り込み・削除する行を決める
+
+    existing: user_id -> 既存の記録日のリスト（取得できなかったユーザーは含まない）
+    """
+    by_user = {}
+    for line_no, row in prepared:
+        by_user.setdefault(row["user_id"], []).append((line_no, row))
+
+    plan = {"kept": [], "skipped": [], "stale": [], "unavailable": []}
+    for user_id, user_rows in by_user.items():
+        if user_id not in existing:
+            plan["unavailable"].extend((line_no, "既存のログを取得できなかったため取り込みません") for line_no, _ in user_rows)
+            continue
+
+        existing_dates = set(existing[user_id])
+        imported = {datetime.datetime.strptime(row["log_date"], DATE_FORMAT).date(): (line_no, row) for line_no, row in user_rows}
+        streak = current_streak(existing_dates | imported.keys(), today)
+
+        for log_date, (line_no, row) in imported.items():
+            if log_date in streak:
+                plan["kept"].append((line_no, row))
+            else:
+                plan["skipped"].append((line_no, "現在の連続記録に含まれないため取り込みません"))
+        plan["stale"].extend(
+            {"user_id": user_id, "log_date": log_date.strftime(DATE_FORMAT)}
+            for log_date in sorted(existing_dates - streak)
+        )
+
+    return plan
+
+
+def find_invalid_streaks(log_dates: dict, today: datetime.date) -> list:
+    """記録日が現在の連続記録だけになっていないユーザーの一覧"""
+    return sorted(
+        user_id
+        for user_id, dates in log_dates.items()
+        if set(dates) != current_streak(dates, today)
+    )
+
+
+def backfill_click_logs(
+    data_manager,
+    rows,
+    chunk_size: int = 500,
+    max_workers: int = 4,
+    progress=None,
+    first_line: int = 1,
+) -> dict:
+    """行を検証・重複排除し、現在の連続記録に合わせて保存・削除して集計を返す
+
+    既存のログの取得・保存・削除・確認は、いずれもまとめて最大 max_workers 並列で行う。
+    保存に失敗した行のあるユーザーの既存のログは削除しない。
+    """
+    today = datetime.date.today()
+    prepared, errors = prepare_rows(rows, first_line)
+    user_ids = sorted({row["user_id"] for _, row in prepared})
+    plan = plan_backfill(prepared, data_manager.load_log_dates(user_ids, max_workers=max_workers), today)
+
+    saved, failed_rows = data_manager.bulk_save_click_logs(
+        [row for _, row in plan["kept"]],
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        progress=progress,
+    )
+    failed_users = {row["user_id"] for row in failed_rows}
+    stale = [row for row in plan["stale"] if row["user_id"] not in failed_users]
+    deleted, delete_failed = data_manager.bulk_delete_click_logs(stale, max_workers=max_workers)
+
+    line_numbers = {(row["user_id"], row["log_date"]): line_no for line_no, row in plan["kept"]}
+    failed = sorted(
+        plan["unavailable"]
+        + [(line_numbers[(row["user_id"], row["log_date"])], "保存に失敗しました") for row in failed_rows]
+    )
+    failed_keys = {(row["user_id"], row["log_date"]) for row in delete_failed}
+    return {
+        "valid": len(prepared),
+        "saved": saved,
+        "skipped": plan["skipped"],
+        "failed": failed,
+        "deleted": [row for row in stale if (row["user_id"], row["log_date"]) not in failed_keys],
+        "delete_failed": delete_failed,
+        "invalid_streaks": find_invalid_streaks(data_manager.load_log_dates(user_ids, max_workers=max_workers), today),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="progress_logs の一括取り込み")
+    parser.add_argument("csv_path", help="user_id,log_date,completion_hour のCSVファイル")
+    parser.add_argument("--chunk-size", type=int, default=500, help="1リクエストあたりの行数")
+    parser.add_argument("--workers", type=int, default=4, help="同時リクエスト数")
+    parser.add_argument("--dry-run", action="store_true", help="検証のみ行い保存しない")
+    args = parser.parse_args()
+
+    with open(args.csv_path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    # 1行目はヘッダー
+    first_line = 2
+
+    if args.dry_run:
+        prepared, errors = prepare_rows(rows, first_line)
+        for line_no, message in errors:
+            print(f"{line_no}行目: {message}", file=sys.stderr)
+        print(f"valid: {len(prepared)}  errors: {len(errors)}")
+        return
+
+    from supabase import create_client
+    from data_manager_supabase import DataManagerSupabase
+
+    supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+    dm = DataManagerSupabase(supabase)
+
+    def progress(done: int, total: int):
+        print(f"\r{done}/{total}", end="", file=sys.stderr, flush=True)
+
+    result = backfill_click_logs(dm, rows, args.chunk_size, args.workers, progress, first_line)
+    print(file=sys.stderr)
+
+    for line_no, message in sorted(result["errors"] + result["skipped"] + result["failed"]):
+        print(f"{line_no}行目: {message}", file=sys.stderr)
+    for row in result["deleted"]:
+        print(f"削除: {row['user_id']} {row['log_date']}（現在の連続記録に含まれない既存のログ）", file=sys.stderr)
+    for row in result["delete_failed"]:
+        print(f"削除に失敗: {row['user_id']} {row['log_date']}", file=sys.stderr)
+    for user_id in result["invalid_streaks"]:
+        print(f"連続記録になっていません: {user_id}", file=sys.stderr)
+    print(
+        f"valid: {result['valid']}  saved: {result['saved']}  skipped: {len(result['skipped'])}"
+        f"  deleted: {len(result['deleted'])}  failed: {len(result['failed']) + len(result['delete_failed'])}"
+        f"  errors: {len(result['errors'])}"
+    )
+    if result["failed"] or result["delete_failed"] or result["invalid_streaks"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import time
+
+from change_notifier import ChangeNotifier
+from constants import CACHE_TTL_SECONDS
+
+
+class CachedDataManager:
+    """DataManager の読み取り結果をキャッシュし、変更通知で無効化するラッパー
+
+    キャッシュは store（通常は st.session_state 内の dict）に保存し、
+    ChangeNotifier のバージョンが変わったときに再取得する。
+    Realtime の通知はクロックのずれで取りこぼすことがあるため、
+    CACHE_TTL_SECONDS を過ぎたエントリもバージョンに関係なく再取得する。
+    返り値はキャッシュと共有されるため、呼び出し側で変更しないこと。
+    """
+
+    # 読み取りメソッドと、その結果が依存するテーブル
+    CACHED_READS = {
+        "load_user_habit": ("habits",),
+        "load_click_logs": ("progress_logs",),
+        "count_click_logs": ("progress_logs",),
+        "load_history": ("habit_history",),
+        "load_history_summary": ("habit_history",),
+    }
+
+    def __init__(self, data_manager, notifier: ChangeNotifier, store: dict = None, ttl: float = CACHE_TTL_SECONDS):
+        self.data_manager = data_manager
+        self.notifier = notifier
+        self.store = store if store is not None else {}
+        self.ttl = ttl
+
+    def __getattr__(self, name):
+        attr = getattr(self.data_manager, name)
+        tables = self.CACHED_READS.get(name)
+        if tables is None:
+            return attr
+
+        def cached(user_id, *args, **kwargs):
+            key = (name, user_id, args, tuple(sorted(kwargs.items())))
+            version = self.notifier.version(user_id, tables)
+
+            now = time.monotonic()
+
+            entry = self.store.get(key)
+            if entry is not None and entry[0] == version and now - entry[1] < self.ttl:
+                return entry[2]
+
+            value = attr(user_id, *args, **kwargs)
+            self.store[key] = (version, now, value)
+            return value
+
+        return cached
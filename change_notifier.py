@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import threading
+import time
+
+from models import parse_date, parse_time
+
+# 変更を監視するテーブル
+WATCHED_TABLES = ("habits", "progress_logs", "habit_history")
+
+
+class ChangeNotifier:
+    """ユーザー単位のテーブル変更通知（プロセス内のバージョン管理）
+
+    テーブルごとにバージョン番号を持ち、変更があるたびに加算する。
+    キャッシュはバージョンを比較するだけで無効化を判定できるため、
+    別スレッドから各セッションの session_state を触る必要がない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+        # (user_id, table) -> 最後にバージョンを上げた時刻（UNIX 時刻）
+        self._published_at = {}
+
+    def publish(self, user_id: str, table: str, committed_at: float = None):
+        """user_id の table が変更されたことを通知する
+
+        committed_at（Realtime から受け取った変更のコミット時刻）を渡した場合、
+        その時刻より後に既にバージョンを上げていれば反映済みとして無視する。
+        自分の書き込みのエコーや、複数行の変更で届く同じトランザクションの
+        イベントで、バージョンが何度も上がらないようにするため。
+        """
+        if not user_id:
+            return
+
+        with self._lock:
+            key = (user_id, table)
+            if committed_at is not None and self._published_at.get(key, 0.0) >= committed_at:
+                return
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._published_at[key] = time.time()
+
+    def version(self, user_id: str, tables=WATCHED_TABLES) -> tuple:
+        """指定テーブルの現在のバージョンを返す"""
+        with self._lock:
+            return tuple(self._versions.get((user_id, table), 0) for table in tables)
+
+
+class RealtimeChangeListener:
+    """Supabase Realtime の変更イベントを ChangeNotifier に転送する
+
+    別プロセス（別サーバー）での書き込みも各セッションに反映させるために使う。
+    RLS を越えて全ユーザーの変更を受け取るため、service role キーで接続する。
+
+    due_index を渡すと、progress_logs・habits の変更を DueIndex にも反映する
+    （別プロセスの書き込みで索引が古くならないようにするため）。
+
+    同じプロセスの書き込みはデータマネージャーが直接通知するため、
+    そのエコーはコミット時刻で判定して ChangeNotifier.publish 側で無視する
+    （DB サーバーとのクロックのずれの分だけ、判定が前後しうる。取りこぼした
+    変更は CachedDataManager の TTL で反映される）。
+    """
+
+    def __init__(self, notifier: ChangeNotifier, url: str, key: str, due_index=None):
+        self.notifier = notifier
+        self.url = url
+        self.key = key
+        self.due_index = due_index
+        self._thread = None
+
+    def start(self):
+        """バックグラウンドスレッドで購読を開始する"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run_forever, name="realtime-listener", daemon=True)
+        self._thread.start()
+
+    def _run_forever(self):
+        try:
+            asyncio.run(self._listen())
+        except Exception as e:
+            print(f"Realtime listener stopped: {e}")
+
+    async def _listen(self):
+        from supabase import acreate_client
+
+        client = await acreate_client(self.url, self.key)
+        channel = client.channel("habit-tracker-changes")
+        for table in WATCHED_TABLES:
+            channel.on_postgres_changes("*", schema="public", table=table, callback=self._on_change)
+        await channel.subscribe()
+
+        # 接続を維持する
+        await asyncio.Event().wait()
+
+    def _on_change(self, payload: dict):
+        data = payload.get("data", payload)
+        table = data.get("table")
+        record = data.get("record") or data.get("old_record") or {}
+        user_id = record.get("user_id")
+
+        if table in WATCHED_TABLES and user_id:
+            self.notifier.publish(user_id, table, _parse_commit_timestamp(data.get("commit_timestamp")))
+            if self.due_index is not None:
+                self._update_due_index(table, data.get("type"), user_id, record)
+
+    def _update_due_index(self, table: str, event: str, user_id: str, record: dict):
+        try:
+            if table == "progress_logs":
+                if event == "DELETE":
+                    # 削除後の最終記録日は分からないため、次にログを取得したときに再設定する
+                    self.due_index.invalidate(user_id)
+                else:
+                    self.due_index.record_log(user_id, parse_date(record["log_date"]))
+            elif table == "habits":
+                active = event != "DELETE" and record.get("active")
+                self.due_index.set_target(user_id, parse_time(record["target_time"]) if active else None)
+        except (KeyError, ValueError) as e:
+            print(f"Error updating due index from realtime: {e}")
+
+
+def _parse_commit_timestamp(value):
+    """Realtime の commit_timestamp を UNIX 時刻に変換する（不明なら None）"""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
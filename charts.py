@@ -0,0 +1,46 @@
+import pandas as pd
+from matplotlib.figure import Figure
+
+
+def progress_dataframe(logs, max_days: int = 30) -> pd.DataFrame:
+    """ログを日付順に並べ、直近 max_days 件に絞った DataFrame を返す"""
+    df = pd.DataFrame(logs)
+    df["log_date"] = pd.to_datetime(df["log_date"])
+    df = df.sort_values(by="log_date").tail(max_days)
+    
+    # 達成回数を計算
+    df['count'] = range(1, len(df) + 1)
+    return df
+
+
+def build_progress_figure(df: pd.DataFrame) -> Figure:
+    """達成時刻の推移グラフを作成する
+
+    pyplot を経由せずに Figure を直接作るため、pyplot のグローバルな
+    図の一覧に登録されず、参照がなくなれば解放される。
+    """
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    
+    ax.plot(df["count"], df["completion_hour"], 
+            marker="o", linestyle="-", color="#ff4b4b", 
+            linewidth=2.5, markersize=8)
+   
+    ax.set_ylim(-1, 24)
+    ax.set_xlim(1, 30)
+    
+    ax.set_yticks(range(0, 24, 2))
+    ax.set_xticks(range(1, 31))
+    
+    ax.set_ylabel("click_hour", fontsize=12, fontweight='bold')
+    ax.set_xlabel("click_count", fontsize=12, fontweight='bold')
+    
+    ax.grid(True, linestyle='--', alpha=0.6)
+    ax.set_title("Achievement time per click", fontsize=14, fontweight='bold', pad=20)
+    
+    # 背景色を設定
+    ax.set_facecolor('#fafafa')
+    fig.patch.set_facecolor('white')
+ 
+    fig.tight_layout()
+    return fig
@@ -0,0 +1,31 @@
+import datetime
+
+
+class SystemClock:
+    """実際の現在時刻を返すクロック"""
+
+    def today(self) -> datetime.date:
+        return datetime.date.today()
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now()
+
+
+class SimulatedClock:
+    """任意の時刻に設定・進められるクロック（シミュレーション・テスト用）"""
+
+    def __init__(self, start: datetime.datetime):
+        self._now = start
+
+    def today(self) -> datetime.date:
+        return self._now.date()
+
+    def now(self) -> datetime.datetime:
+        return self._now
+
+    def set(self, value: datetime.datetime):
+        self._now = value
+
+    def advance(self, **kwargs):
+        """datetime.timedelta と同じ引数で時刻を進める"""
+        self._now += datetime.timedelta(**kwargs)
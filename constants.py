@@ -3,4 +3,12 @@ import datetime
 DATE_FORMAT = "%Y-%m-%d"
 MAX_CHALLENGE_DAYS = 30
 MISS_DAYS_THRESHOLD = 2  # 2日以上記録がない場合リセット
-TIME_INPUT_DEFAULT = datetime.time(8, 0)
\ No newline at end of file
+TIME_INPUT_DEFAULT = datetime.time(8, 0)
+CHANGE_WATCH_INTERVAL_SECONDS = 5  # 他のタブでの変更を確認する間隔
+CACHE_TTL_SECONDS = 60  # 変更通知がなくても読み取り結果を再取得するまでの時間
+PROFILE_OUTPUT_DIR = "profiles"  # リランの計測結果（collapsed stack）の出力先
+PROFILE_MAX_FILES = 50  # 残しておく計測結果の数
+HOURS_PER_DAY = 24
+NOTIFICATION_DEDUP_TTL_SECONDS = 2 * 24 * 60 * 60  # 同じ通知を再送しない期間
+NOTIFICATION_RATE_LIMIT = 5  # ユーザーごとの通知数の上限
+NOTIFICATION_RATE_WINDOW_SECONDS = 60 * 60  # レート制限の集計期間
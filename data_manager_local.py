@@ -0,0 +1,183 @@
+import dataclasses
+import threading
+from typing import Optional
+
+from history_stats import apply_history_record
+from models import Habit, HistoryRecord, HistorySummary, ProgressLog, parse_date, parse_time
+
+
+class DataManagerLocal:
+    """DataManagerSupabase と同じインターフェースを持つインメモリ実装
+
+    テストやシミュレーション用。全操作をロックで直列化するため、
+    complete_challenge などの複合操作も途中状態が見えることはない。
+    """
+
+    def __init__(self, notifier=None, due_index=None):
+        # 書き込み時に変更を通知する ChangeNotifier（任意）
+        self.notifier = notifier
+        # 書き込み時に更新する DueIndex（任意）
+        self.due_index = due_index
+        self._lock = threading.RLock()
+        self._habits = {}
+        self._logs = {}
+        self._history = {}
+        self._history_summary = {}
+
+    def _notify(self, user_id: str, *tables: str):
+        if self.notifier:
+            for table in tables:
+                self.notifier.publish(user_id, table)
+
+    # -------- habits --------
+
+    def load_user_habit(self, user_id: str) -> Optional[Habit]:
+        with self._lock:
+            habit = self._habits.get(user_id)
+            if habit and habit.active:
+                return habit
+            return None
+
+    def save_user_habit(self, user_id: str, name: str, target_time: str) -> bool:
+        with self._lock:
+            self._habits[user_id] = Habit(user_id=user_id, name=name, target_time=parse_time(target_time))
+        self._notify(user_id, "habits")
+        if self.due_index is not None:
+            self.due_index.set_target(user_id, parse_time(target_time))
+        return True
+
+    # -------- progress_logs --------
+
+    def _select_logs(self, user_id: str, since: Optional[str], cursor: Optional[str]) -> list:
+        logs = self._logs.get(user_id, {})
+        dates = sorted(logs, reverse=True)
+        if since:
+            since_date = parse_date(since)
+            dates = [d for d in dates if d >= since_date]
+        if cursor:
+            cursor_date = parse_date(cursor)
+            dates = [d for d in dates if d < cursor_date]
+        return [logs[d] for d in dates]
+
+    def load_click_logs(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        since: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> list:
+        with self._lock:
+            rows = self._select_logs(user_id, since, cursor)
+            return rows if limit is None else rows[:limit]
+
+    def count_click_logs(self, user_id: str, since: Optional[str] = None) -> int:
+        with self._lock:
+            return len(self._select_logs(user_id, since, None))
+
+    def save_click_log(self, user_id: str, log_date: str, hour: int) -> bool:
+        with self._lock:
+            log = ProgressLog(log_date=parse_date(log_date), completion_hour=hour)
+            self._logs.setdefault(user_id, {})[log.log_date] = log
+        self._notify(user_id, "progress_logs")
+        if self.due_index is not None:
+            self.due_index.record_log(user_id, log.log_date)
+        return True
+
+    def bulk_save_click_logs(
+        self,
+        rows: list,
+        chunk_size: int = 500,
+        max_workers: int = 4,
+        progress=None,
+    ) -> tuple:
+        with self._lock:
+            for i, row in enumerate(rows, 1):
+                log = ProgressLog(log_date=parse_date(row["log_date"]), completion_hour=row["completion_hour"])
+                self._logs.setdefault(row["user_id"], {})[log.log_date] = log
+                if progress and (i % chunk_size == 0 or i == len(rows)):
+                    progress(i, len(rows))
+
+        for user_id in {row["user_id"] for row in rows}:
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                self.due_index.record_log(user_id, max(self._logs[user_id]))
+        return len(rows), []
+
+    def load_log_dates(self, user_ids: list, chunk_size: int = 100, max_workers: int = 4) -> dict:
+        with self._lock:
+            return {user_id: sorted(self._logs.get(user_id, {})) for user_id in user_ids}
+
+    def bulk_delete_click_logs(self, rows: list, max_workers: int = 4) -> tuple:
+        with self._lock:
+            for row in rows:
+                self._logs.get(row["user_id"], {}).pop(parse_date(row["log_date"]), None)
+        for user_id in {row["user_id"] for row in rows}:
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                logs = self._logs.get(user_id)
+                self.due_index.set_last_log(user_id, max(logs) if logs else None)
+        return len(rows), []
+
+    def delete_click_log(self, user_id: str, log_date: str) -> bool:
+        with self._lock:
+            logs = self._logs.get(user_id, {})
+            logs.pop(parse_date(log_date), None)
+            last_log = max(logs) if logs else None
+        self._notify(user_id, "progress_logs")
+        if self.due_index is not None:
+            self.due_index.set_last_log(user_id, last_log)
+        return True
+
+    def reset_click_logs(self, user_id: str) -> bool:
+        with self._lock:
+            self._logs.pop(user_id, None)
+        self._notify(user_id, "progress_logs")
+        if self.due_index is not None:
+            self.due_index.set_last_log(user_id, None)
+        return True
+
+    def load_due_snapshot(self) -> list:
+        with self._lock:
+            return [
+                {
+                    "user_id": user_id,
+                    "target_time": habit.target_time.isoformat(),
+                    "last_log_date": max(self._logs[user_id]).isoformat() if self._logs.get(user_id) else None,
+                }
+                for user_id, habit in self._habits.items()
+                if habit.active
+            ]
+
+    # -------- history --------
+
+    def load_history(self, user_id: str) -> list:
+        with self._lock:
+            rows = self._history.get(user_id, [])
+            return sorted(rows, key=lambda r: r.archived_at, reverse=True)
+
+    def save_history(self, record: HistoryRecord) -> bool:
+        with self._lock:
+            user_id = record.user_id
+            self._history.setdefault(user_id, []).append(record)
+            summary = self._history_summary.get(user_id) or HistorySummary.empty(user_id)
+            self._history_summary[user_id] = apply_history_record(summary, record)
+        self._notify(user_id, "habit_history")
+        return True
+
+    def load_history_summary(self, user_id: str) -> HistorySummary:
+        with self._lock:
+            return self._history_summary.get(user_id) or HistorySummary.empty(user_id)
+
+    # -------- challenge --------
+
+    def complete_challenge(self, user_id: str, record: HistoryRecord) -> bool:
+        """履歴保存・ログリセット・習慣の無効化をまとめて行う"""
+        with self._lock:
+            self.save_history(dataclasses.replace(record, user_id=user_id))
+            self.reset_click_logs(user_id)
+            if user_id in self._habits:
+                self._habits[user_id] = dataclasses.replace(self._habits[user_id], active=False)
+        self._notify(user_id, "habits")
+        if self.due_index is not None:
+            self.due_index.set_target(user_id, None)
+        return True
@@ -1,31 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
 from supabase import Client
 
+from models import Habit, HistoryRecord, HistorySummary, ProgressLog, parse_date, parse_time
+
+# 取得する列（モデルが使う列だけを取得して転送量を抑える）
+HABIT_COLUMNS = "user_id, name, target_time, active"
+PROGRESS_LOG_COLUMNS = "log_date, completion_hour"
+HISTORY_COLUMNS = "id, user_id, habit_name, target_time, archived_at, total_days, log_summary"
+HISTORY_SUMMARY_COLUMNS = "user_id, total_habits, total_days, best_streak, hour_histogram"
+
+# 1リクエストで取得できる最大行数（supabase/config.toml の max_rows と同じ）
+PAGE_SIZE = 1000
+
 
 class DataManagerSupabase:
-    def __init__(self, supabase: Client):
+    def __init__(self, supabase: Client, notifier=None, due_index=None):
         self.supabase = supabase
+        # 書き込み時に変更を通知する ChangeNotifier（任意）
+        self.notifier = notifier
+        # 書き込み時に更新する DueIndex（任意）
+        self.due_index = due_index
+
+    def _notify(self, user_id: str, *tables: str):
+        if self.notifier:
+            for table in tables:
+                self.notifier.publish(user_id, table)
+
+    def _fetch_all(self, build_query) -> list:
+        """max_rows で切られないよう、PAGE_SIZE 件ずつページングして全行を取得する
+
+        build_query は並び順を指定済みのクエリを毎回新しく作る関数。
+        """
+        rows = []
+        while True:
+            res = build_query().range(len(rows), len(rows) + PAGE_SIZE - 1).execute()
+            page = res.data if res and hasattr(res, 'data') and res.data else []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
 
     # -------- habits --------
 
-    def load_user_habit(self, user_id: str) -> dict:
+    def load_user_habit(self, user_id: str) -> Optional[Habit]:
         try:
             res = (
                 self.supabase
                 .table("habits")
-                .select("*")
+                .select(HABIT_COLUMNS)
                 .eq("user_id", user_id)
+                .eq("active", True)
                 .maybe_single()
                 .execute()
             )
             if res and hasattr(res, 'data') and res.data:
-                # target_timeがtime型の場合、文字列に変換
-                if res.data.get('target_time') and not isinstance(res.data['target_time'], str):
-                    res.data['target_time'] = str(res.data['target_time'])
-                return res.data
-            return {}
+                return Habit.from_row(res.data)
+            return None
         except Exception as e:
             print(f"Error loading user habit: {e}")
-            return {}
+            return None
 
     def save_user_habit(self, user_id: str, name: str, target_time: str) -> bool:
         try:
@@ -39,11 +73,15 @@ class DataManagerSupabase:
             res = (
                 self.supabase
                 .table("habits")
-                .upsert(data, on_conflict="user_id")
+                .upsert(data, on_conflict="user_id", returning="minimal")
                 .execute()
             )
+            self._notify(user_id, "habits")
+            if self.due_index is not None:
+                self.due_index.set_target(user_id, parse_time(target_time))
             
-            return res is not None and hasattr(res, 'data') and bool(res.data)
+            # returning="minimal" のため行は返らない（失敗時は例外になる）
+            return res is not None
                 
         except Exception as e:
             print(f"Error saving user habit: {e}")
@@ -51,23 +89,63 @@ class DataManagerSupabase:
 
     # -------- progress_logs --------
 
-    def load_click_logs(self, user_id: str) -> list:
+    def load_click_logs(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        since: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> list:
+        """進捗ログを新しい順に取得する
+
+        limit: 取得する最大件数
+        since: この日付 (YYYY-MM-DD) 以降のログのみ取得
+        cursor: キーセットページング用。この日付より古いログのみ取得
+                (前ページ最後の log_date を渡す)
+        """
         try:
-            res = (
+            query = (
                 self.supabase
                 .table("progress_logs")
-                .select("log_date, completion_hour")
+                .select(PROGRESS_LOG_COLUMNS)
                 .eq("user_id", user_id)
-                .order("log_date", desc=True)
-                .execute()
             )
+            if since:
+                query = query.gte("log_date", since)
+            if cursor:
+                query = query.lt("log_date", cursor)
+            query = query.order("log_date", desc=True)
+            if limit is not None:
+                query = query.limit(limit)
+
+            res = query.execute()
             if res and hasattr(res, 'data') and res.data:
-                return res.data
+                return [ProgressLog.from_row(row) for row in res.data]
             return []
         except Exception as e:
             print(f"Error loading click logs: {e}")
             return []
 
+    def count_click_logs(self, user_id: str, since: Optional[str] = None) -> int:
+        """進捗ログの件数を取得する（行データは取得しない）"""
+        try:
+            query = (
+                self.supabase
+                .table("progress_logs")
+                .select("log_date", count="exact", head=True)
+                .eq("user_id", user_id)
+            )
+            if since:
+                query = query.gte("log_date", since)
+
+            res = query.execute()
+            if res and getattr(res, 'count', None) is not None:
+                return res.count
+            return 0
+        except Exception as e:
+            print(f"Error counting click logs: {e}")
+            return 0
+
     def save_click_log(self, user_id: str, log_date: str, hour: int) -> bool:
         try:
             res = (
@@ -79,25 +157,149 @@ class DataManagerSupabase:
                         "log_date": log_date,
                         "completion_hour": hour,
                     },
-                    on_conflict="user_id,log_date"
+                    on_conflict="user_id,log_date",
+                    returning="minimal",
                 )
                 .execute()
             )
-            return res is not None and hasattr(res, 'data') and bool(res.data)
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                self.due_index.record_log(user_id, parse_date(log_date))
+            return res is not None
         except Exception as e:
             print(f"Error saving click log: {e}")
             return False
 
+    def bulk_save_click_logs(
+        self,
+        rows: list,
+        chunk_size: int = 500,
+        max_workers: int = 4,
+        progress=None,
+    ) -> tuple:
+        """検証・重複排除済みのログをまとめて upsert する
+
+        rows: {"user_id", "log_date", "completion_hour"} の dict のリスト
+        chunk_size 件ずつ、最大 max_workers 並列でリクエストする。
+        progress(完了件数, 全件数) を渡すとチャンクごとに呼び出す。
+        変更通知は全チャンクの完了後に、保存できたユーザーごとに1回だけ行う。
+        (保存できた件数, 保存できなかった行のリスト) を返す。
+        """
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        saved_rows = []
+        failed_rows = []
+        done = 0
+
+        def upsert_chunk(chunk: list):
+            self.supabase.table("progress_logs").upsert(
+                chunk, on_conflict="user_id,log_date", returning="minimal"
+            ).execute()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(upsert_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    future.result()
+                    saved_rows.extend(chunk)
+                except Exception as e:
+                    print(f"Error saving click log chunk: {e}")
+                    failed_rows.extend(chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, len(rows))
+
+        last_dates = {}
+        for row in saved_rows:
+            last_dates[row["user_id"]] = max(last_dates.get(row["user_id"], row["log_date"]), row["log_date"])
+        for user_id, log_date in last_dates.items():
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                self.due_index.record_log(user_id, parse_date(log_date))
+        return len(saved_rows), failed_rows
+
+    def load_log_dates(self, user_ids: list, chunk_size: int = 100, max_workers: int = 4) -> dict:
+        """複数ユーザーの記録日をまとめて取得する（user_id -> 古い順の記録日のリスト）
+
+        chunk_size 人ずつ in 句でまとめ、最大 max_workers 並列でリクエストする。
+        取得に失敗したチャンクのユーザーは結果に含めない。
+        """
+        chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+        result = {}
+
+        def load_chunk(chunk: list) -> list:
+            return self._fetch_all(
+                lambda: self.supabase
+                .table("progress_logs")
+                .select("user_id, log_date")
+                .in_("user_id", chunk)
+                .order("user_id")
+                .order("log_date")
+            )
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(load_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    print(f"Error loading log dates: {e}")
+                    continue
+                for user_id in futures[future]:
+                    result[user_id] = []
+                for row in rows:
+                    result[row["user_id"]].append(parse_date(row["log_date"]))
+        return result
+
+    def bulk_delete_click_logs(self, rows: list, max_workers: int = 4) -> tuple:
+        """指定したログをユーザーごとに1リクエストで削除する
+
+        rows: {"user_id", "log_date"} の dict のリスト
+        (削除できた件数, 削除できなかった行のリスト) を返す。
+        """
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row["user_id"], []).append(row)
+        deleted = 0
+        failed_rows = []
+
+        def delete_user_logs(user_id: str, user_rows: list):
+            self.supabase.table("progress_logs").delete(returning="minimal").eq(
+                "user_id", user_id
+            ).in_("log_date", [row["log_date"] for row in user_rows]).execute()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(delete_user_logs, user_id, user_rows): (user_id, user_rows)
+                for user_id, user_rows in by_user.items()
+            }
+            for future in as_completed(futures):
+                user_id, user_rows = futures[future]
+                try:
+                    future.result()
+                    deleted += len(user_rows)
+                    self._notify(user_id, "progress_logs")
+                    if self.due_index is not None:
+                        self.due_index.invalidate(user_id)
+                except Exception as e:
+                    print(f"Error deleting click logs: {e}")
+                    failed_rows.extend(user_rows)
+        return deleted, failed_rows
+
     def delete_click_log(self, user_id: str, log_date: str) -> bool:
         try:
             res = (
                 self.supabase
                 .table("progress_logs")
-                .delete()
+                .delete(returning="minimal")
                 .eq("user_id", user_id)
                 .eq("log_date", log_date)
                 .execute()
             )
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                # 直前の記録日は分からないため、次にチャレンジ画面でログを取得したときに再設定する
+                self.due_index.invalidate(user_id)
             # deleteの場合はstatus_codeをチェック
             return res is not None and (
                 hasattr(res, 'status_code') and res.status_code == 204 or
@@ -112,10 +314,13 @@ class DataManagerSupabase:
             res = (
                 self.supabase
                 .table("progress_logs")
-                .delete()
+                .delete(returning="minimal")
                 .eq("user_id", user_id)
                 .execute()
             )
+            self._notify(user_id, "progress_logs")
+            if self.due_index is not None:
+                self.due_index.set_last_log(user_id, None)
             # deleteの場合はstatus_codeをチェック
             return res is not None and (
                 hasattr(res, 'status_code') and res.status_code == 204 or
@@ -125,6 +330,26 @@ class DataManagerSupabase:
             print(f"Error resetting click logs: {e}")
             return False
 
+    def load_due_snapshot(self) -> list:
+        """DueIndex 構築用に、アクティブな習慣の目標時刻と最終記録日を取得する
+
+        user_id のキーセットで PAGE_SIZE 件ずつページングし、全ユーザー分を返す。
+        途中で失敗した場合は空のリストを返す（索引にないユーザーはログから判定される）。
+        """
+        try:
+            rows = []
+            after = None
+            while True:
+                res = self.supabase.rpc("due_index_snapshot", {"p_after": after, "p_limit": PAGE_SIZE}).execute()
+                page = res.data if res and hasattr(res, 'data') and res.data else []
+                rows.extend(page)
+                if len(page) < PAGE_SIZE:
+                    return rows
+                after = page[-1]["user_id"]
+        except Exception as e:
+            print(f"Error loading due snapshot: {e}")
+            return []
+
     # -------- history --------
 
     def load_history(self, user_id: str) -> list:
@@ -132,27 +357,65 @@ class DataManagerSupabase:
             res = (
                 self.supabase
                 .table("habit_history")
-                .select("*")
+                .select(HISTORY_COLUMNS)
                 .eq("user_id", user_id)
                 .order("archived_at", desc=True)
                 .execute()
             )
             if res and hasattr(res, 'data') and res.data:
-                return res.data
+                return [HistoryRecord.from_row(row) for row in res.data]
             return []
         except Exception as e:
             print(f"Error loading history: {e}")
             return []
 
-    def save_history(self, record: dict) -> bool:
+    def save_history(self, record: HistoryRecord) -> bool:
         try:
             res = (
                 self.supabase
                 .table("habit_history")
-                .insert(record)
+                .insert(record.to_row(), returning="minimal")
                 .execute()
             )
-            return res is not None and hasattr(res, 'data') and bool(res.data)
+            self._notify(record.user_id, "habit_history")
+            return res is not None
         except Exception as e:
             print(f"Error saving history: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def load_history_summary(self, user_id: str) -> HistorySummary:
+        """履歴の集計（達成数・累計日数・最長記録・平均達成時刻の分布）を取得する"""
+        try:
+            res = (
+                self.supabase
+                .table("habit_history_summary")
+                .select(HISTORY_SUMMARY_COLUMNS)
+                .eq("user_id", user_id)
+                .maybe_single()
+                .execute()
+            )
+            if res and hasattr(res, 'data') and res.data:
+                return HistorySummary.from_row(res.data)
+            return HistorySummary.empty(user_id)
+        except Exception as e:
+            print(f"Error loading history summary: {e}")
+            return HistorySummary.empty(user_id)
+
+    # -------- challenge --------
+
+    def complete_challenge(self, user_id: str, record: HistoryRecord) -> bool:
+        """履歴保存・ログリセット・習慣の無効化を1回のRPCでまとめて行う"""
+        try:
+            res = (
+                self.supabase
+                .rpc("complete_challenge", {"p_user_id": user_id, "p_record": record.to_row()})
+                .execute()
+            )
+            self._notify(user_id, "habits", "progress_logs", "habit_history")
+            if self.due_index is not None:
+                self.due_index.set_last_log(user_id, None)
+                self.due_index.set_target(user_id, None)
+            return res is not None and hasattr(res, 'data') and bool(res.data)
+        except Exception as e:
+            print(f"Error completing challenge: {e}")
+            return False
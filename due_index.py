@@ -0,0 +1,143 @@
+import bisect
+import datetime
+import threading
+from typing import Optional
+
+from constants import MISS_DAYS_THRESHOLD
+from models import parse_date, parse_time
+
+# 最終記録日が分からなくなった（ログを削除した直後で再取得できていない）ことを表す
+_UNKNOWN = object()
+
+
+class DueIndex:
+    """ユーザーごとの最終記録日と目標時刻を保持するインメモリ索引
+
+    起動時に load_due_snapshot() の1回のクエリで全件を構築し、以降は
+    データマネージャーの書き込みに合わせて更新する。
+    「今日記録できるか」「記録忘れでリセット対象か」をユーザーごとに O(1) で、
+    「リセット対象・リマインド対象のユーザー一覧」を最終記録日の範囲走査で返す。
+
+    日付は ordinal（int）、目標時刻は 0時からの分（int）で保持する。
+    索引に載っていないユーザーは「不明」として None を返すので、
+    呼び出し側はログを取得して判定する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> (最終記録日の ordinal・None・_UNKNOWN のいずれか, 目標時刻の分 または None)
+        self._entries = {}
+        # 最終記録日のあるユーザーの (ordinal, user_id) を昇順に保持する
+        self._by_last_log = []
+
+    # -------- 構築・更新 --------
+
+    def rebuild(self, rows):
+        """スナップショット（user_id, target_time, last_log_date の行）から作り直す"""
+        entries = {}
+        for row in rows:
+            last_log = parse_date(row["last_log_date"]).toordinal() if row.get("last_log_date") else None
+            target = _to_minute(parse_time(row["target_time"])) if row.get("target_time") else None
+            entries[row["user_id"]] = (last_log, target)
+
+        by_last_log = sorted((last, user_id) for user_id, (last, _) in entries.items() if last is not None)
+        with self._lock:
+            self._entries = entries
+            self._by_last_log = by_last_log
+
+    def set_last_log(self, user_id: str, log_date: Optional[datetime.date]):
+        """最終記録日を設定する（ログがなくなった場合は None）"""
+        with self._lock:
+            self._set_last_log(user_id, log_date.toordinal() if log_date else None)
+
+    def record_log(self, user_id: str, log_date: datetime.date):
+        """ログの追加を反映する（既存の最終記録日より新しい場合のみ更新）"""
+        new_last = log_date.toordinal()
+        with self._lock:
+            last, _ = self._entries.get(user_id, (None, None))
+            if not isinstance(last, int) or new_last > last:
+                self._set_last_log(user_id, new_last)
+
+    def set_target(self, user_id: str, target_time: Optional[datetime.time]):
+        """目標時刻を設定する（習慣が無効になった場合は None）"""
+        with self._lock:
+            last, _ = self._entries.get(user_id, (None, None))
+            self._entries[user_id] = (last, _to_minute(target_time) if target_time else None)
+
+    def invalidate(self, user_id: str):
+        """最終記録日を「不明」にする（目標時刻は残す）
+
+        次にログを取得したときに set_last_log で再設定される。
+        """
+        with self._lock:
+            if user_id in self._entries:
+                self._set_last_log(user_id, _UNKNOWN)
+
+    def _set_last_log(self, user_id: str, new_last):
+        # ロックを取得した状態で呼ぶ
+        last, target = self._entries.get(user_id, (None, None))
+        self._unlink(user_id, last)
+        self._entries[user_id] = (new_last, target)
+        if isinstance(new_last, int):
+            bisect.insort(self._by_last_log, (new_last, user_id))
+
+    def _unlink(self, user_id: str, last):
+        if not isinstance(last, int):
+            return
+        i = bisect.bisect_left(self._by_last_log, (last, user_id))
+        if i < len(self._by_last_log) and self._by_last_log[i] == (last, user_id):
+            del self._by_last_log[i]
+
+    # -------- 参照 --------
+
+    def last_log_date(self, user_id: str):
+        """最終記録日。記録がなければ None、索引にないか不明なユーザーは KeyError"""
+        with self._lock:
+            last, _ = self._entries[user_id]
+        if last is _UNKNOWN:
+            raise KeyError(user_id)
+        return datetime.date.fromordinal(last) if last is not None else None
+
+    def can_click_today(self, user_id: str, today: datetime.date) -> Optional[bool]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] is _UNKNOWN:
+            return None
+        return entry[0] != today.toordinal()
+
+    def is_overdue(self, user_id: str, today: datetime.date) -> Optional[bool]:
+        """MISS_DAYS_THRESHOLD日を超えて記録がないか"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[0] is _UNKNOWN:
+            return None
+        return entry[0] is not None and today.toordinal() - entry[0] > MISS_DAYS_THRESHOLD
+
+    def overdue_users(self, today: datetime.date) -> list:
+        """リセット対象のユーザー一覧（最終記録日の範囲走査）"""
+        limit = today.toordinal() - MISS_DAYS_THRESHOLD
+        with self._lock:
+            end = bisect.bisect_left(self._by_last_log, (limit,))
+            return [user_id for _, user_id in self._by_last_log[:end]]
+
+    def due_users(self, today: datetime.date, now: datetime.time) -> list:
+        """目標時刻を過ぎてもまだ今日の記録がない、アクティブなユーザー一覧（リマインド対象）
+
+        最終記録日が不明なユーザーは、誤って通知しないよう含めない。
+        """
+        today_ordinal = today.toordinal()
+        now_minute = _to_minute(now)
+        with self._lock:
+            return [
+                user_id
+                for user_id, (last, target) in self._entries.items()
+                if target is not None and target <= now_minute and last is not _UNKNOWN and last != today_ordinal
+            ]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _to_minute(value: datetime.time) -> int:
+    return value.hour * 60 + value.minute
@@ -1,41 +1,120 @@
 import datetime
-from constants import DATE_FORMAT, MAX_CHALLENGE_DAYS
+from clock import SystemClock
+from constants import DATE_FORMAT, MAX_CHALLENGE_DAYS, MISS_DAYS_THRESHOLD
+from models import HistoryRecord
  
  
 class HabitTracker:
-    def __init__(self, data_manager):
+    def __init__(self, data_manager, clock=None, due_index=None):
         self.data_manager = data_manager
+        # 日付・時刻の取得元（シミュレーションでは SimulatedClock を渡す）
+        self.clock = clock or SystemClock()
+        # 記録が必要なユーザーの索引（任意）
+        self.due_index = due_index
  
     # ------------------ ログの取得と状態 ------------------
  
-    def get_logs(self, user_id):
+    def get_logs(self, user_id, limit=None, since=None, cursor=None):
         """ユーザーの進捗ログを取得する (最新順)"""
-        return self.data_manager.load_click_logs(user_id)
+        return self.data_manager.load_click_logs(user_id, limit=limit, since=since, cursor=cursor)
+
+    def count_logs(self, user_id, since=None):
+        """ユーザーの進捗ログの件数を取得する"""
+        return self.data_manager.count_click_logs(user_id, since=since)
  
     def get_click_status(self, logs: list):
         """現在のクリック状況（連続日数、最新日）を取得する"""
         total_click_count = len(logs)
-        last_click_date = logs[0]["log_date"] if logs else None
+        last_click_date = logs[0].log_date if logs else None
         return total_click_count, last_click_date
  
     def is_completed(self, count: int) -> bool:
         """チャレンジ完了（MAX_CHALLENGE_DAYSに達したか）を判定する"""
         return count >= MAX_CHALLENGE_DAYS
+
+    def needs_reset(self, count: int, last_click_date: datetime.date) -> bool:
+        """MISS_DAYS_THRESHOLD日を超えて記録がなく、連続日数をリセットすべきかを判定する"""
+        if last_click_date is None or count == 0:
+            return False
+        return (self.clock.today() - last_click_date).days > MISS_DAYS_THRESHOLD
+
+    # ------------------ 索引による判定 ------------------
+
+    def sync_due_index(self, user_id: str, last_click_date: datetime.date):
+        """取得済みのログで索引の最終記録日を更新する"""
+        if self.due_index is not None:
+            self.due_index.set_last_log(user_id, last_click_date)
+
+    def get_challenge_status(self, user_id: str):
+        """チャレンジ画面の状態 (連続日数, 最終記録日, ログ) を取得する
+
+        索引に最終記録日があれば件数だけを数え、ログ本体は取得しない（ログは None）。
+        チャレンジ完了時は履歴に残すためにログも取得する。
+        索引で分からないユーザーはログを取得して判定し、索引に反映する。
+        """
+        if self.due_index is not None:
+            try:
+                last_click_date = self.due_index.last_log_date(user_id)
+            except KeyError:
+                pass
+            else:
+                count = min(self.count_logs(user_id), MAX_CHALLENGE_DAYS)
+                logs = self.get_logs(user_id, limit=MAX_CHALLENGE_DAYS) if self.is_completed(count) else None
+                return count, last_click_date, logs
+
+        logs = self.get_logs(user_id, limit=MAX_CHALLENGE_DAYS)
+        count, last_click_date = self.get_click_status(logs)
+        self.sync_due_index(user_id, last_click_date)
+        return count, last_click_date, logs
+
+    def user_can_click_today(self, user_id: str, last_click_date: datetime.date) -> bool:
+        """今日記録できるか（索引で判定し、分からなければ最終記録日で判定する）"""
+        if self.due_index is not None:
+            known = self.due_index.can_click_today(user_id, self.clock.today())
+            if known is not None:
+                return known
+        return self.can_click_today(last_click_date)
+
+    def user_needs_reset(self, user_id: str, count: int, last_click_date: datetime.date) -> bool:
+        """連続日数をリセットすべきか
+
+        索引でリセット不要と分かればそのまま返す。リセットはログを削除するため、
+        索引がリセット対象と判定した場合も、最新のログで確認してから True を返す
+        （索引は他のプロセスの書き込みの反映が遅れることがある）。
+        """
+        if self.due_index is None or count == 0:
+            return self.needs_reset(count, last_click_date)
+        if self.due_index.is_overdue(user_id, self.clock.today()) is False:
+            return False
+
+        latest = self.get_logs(user_id, limit=1)
+        _, latest_date = self.get_click_status(latest)
+        self.sync_due_index(user_id, latest_date)
+        return self.needs_reset(count, latest_date)
+
+    def overdue_users(self) -> list:
+        """連続日数のリセット対象となるユーザー一覧"""
+        return self.due_index.overdue_users(self.clock.today()) if self.due_index is not None else []
+
+    def due_users(self) -> list:
+        """目標時刻を過ぎても今日の記録がないユーザー一覧（リマインド対象）"""
+        if self.due_index is None:
+            return []
+        now = self.clock.now()
+        return self.due_index.due_users(now.date(), now.time())
  
     # ------------------ クリック・記録 ------------------
  
-    def can_click_today(self, last_click_date: str) -> bool:
+    def can_click_today(self, last_click_date: datetime.date) -> bool:
         """今日、記録ボタンをクリックできるか（最後にクリックした日が今日ではないか）を判定する"""
-        today_str = datetime.date.today().strftime(DATE_FORMAT)
-       
         if last_click_date is None:
             return True
            
-        return last_click_date != today_str
+        return last_click_date != self.clock.today()
  
     def record_today(self, user_id: str):
         """今日の習慣の達成ログを保存する"""
-        now = datetime.datetime.now()
+        now = self.clock.now()
         log_date = now.strftime(DATE_FORMAT)
         completion_hour = now.hour
        
@@ -43,26 +122,31 @@ class HabitTracker:
     
     def delete_today_log(self, user_id: str):
         """今日のログを削除する（取り消し機能）"""
-        today_str = datetime.date.today().strftime(DATE_FORMAT)
+        today_str = self.clock.today().strftime(DATE_FORMAT)
         self.data_manager.delete_click_log(user_id, today_str)
  
     # ------------------ チャレンジ完了・リセット ------------------
  
-    def archive(self, user_id: str, habit_name: str, target_time: str):
-        """チャレンジを完了し、習慣履歴テーブルに保存する"""
-        logs = self.get_logs(user_id)
-        logs.reverse()
-       
-        history_record = {
-            "user_id": user_id,
-            "habit_name": habit_name,
-            "target_time": target_time,
-            "archived_at": datetime.datetime.now().isoformat(),
-            "total_days": len(logs),
-            "log_summary": logs,
-        }
- 
-        self.data_manager.save_history(history_record)
+    def build_history_record(self, user_id: str, habit_name: str, target_time: datetime.time, logs: list) -> HistoryRecord:
+        """最新順のログから習慣履歴レコードを作成する"""
+        log_summary = tuple(reversed(logs))
+
+        return HistoryRecord(
+            user_id=user_id,
+            habit_name=habit_name,
+            target_time=target_time,
+            archived_at=self.clock.now(),
+            total_days=len(log_summary),
+            log_summary=log_summary,
+        )
+
+    def complete_challenge(self, user_id: str, habit_name: str, target_time: datetime.time, logs: list) -> bool:
+        """履歴保存・ログリセット・習慣の無効化を1回の操作で行う
+
+        logs には画面表示のために取得済みのログ (最新順) を渡す。
+        """
+        history_record = self.build_history_record(user_id, habit_name, target_time, logs)
+        return self.data_manager.complete_challenge(user_id, history_record)
  
     def reset_logs(self, user_id: str):
         """progress_logsテーブルの記録をリセットする"""
@@ -0,0 +1,66 @@
+import dataclasses
+
+import numpy as np
+
+from constants import HOURS_PER_DAY
+from models import HistoryRecord, HistorySummary
+
+
+def average_completion_hour(log_summary):
+    """ログの平均達成時刻を返す（ログがない場合は None）"""
+    if not log_summary:
+        return None
+    return sum(log.completion_hour for log in log_summary) / len(log_summary)
+
+
+def apply_history_record(summary: HistorySummary, record: HistoryRecord) -> HistorySummary:
+    """履歴レコード1件分を集計に加算する
+
+    supabase/migrations の apply_habit_history_summary トリガーと同じ計算を行う。
+    """
+    histogram = list(summary.hour_histogram)
+
+    avg_hour = average_completion_hour(record.log_summary)
+    if avg_hour is not None:
+        bucket = min(max(int(avg_hour), 0), HOURS_PER_DAY - 1)
+        histogram[bucket] += 1
+
+    return dataclasses.replace(
+        summary,
+        total_habits=summary.total_habits + 1,
+        total_days=summary.total_days + record.total_days,
+        best_streak=max(summary.best_streak, record.total_days),
+        hour_histogram=tuple(histogram),
+    )
+
+
+def build_calendar_heatmap(history: list) -> dict:
+    """全履歴のログを 日付 × 時刻 のグリッドに集計する
+
+    グリッドは1回の bincount で作り、記録のあるマスだけを列ごとの配列で返す。
+    """
+    dates = []
+    hours = []
+    for record in history:
+        for log in record.log_summary:
+            dates.append(log.log_date)
+            hours.append(log.completion_hour)
+
+    if not dates:
+        return {"date": [], "hour": [], "count": []}
+
+    days = np.array(dates, dtype="datetime64[D]")
+    hour_idx = np.clip(np.array(hours, dtype=np.int64), 0, HOURS_PER_DAY - 1)
+
+    start = days.min()
+    day_idx = (days - start).astype(np.int64)
+    n_days = int(day_idx.max()) + 1
+
+    grid = np.bincount(day_idx * HOURS_PER_DAY + hour_idx, minlength=n_days * HOURS_PER_DAY)
+    cells = np.flatnonzero(grid)
+
+    return {
+        "date": (start + cells // HOURS_PER_DAY).astype(str).tolist(),
+        "hour": (cells % HOURS_PER_DAY).tolist(),
+        "count": grid[cells].tolist(),
+    }
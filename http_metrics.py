@@ -0,0 +1,79 @@
+import threading
+from urllib.parse import parse_qsl, urlsplit
+
+# 値をそのまま集計キーに残すパラメータ（それ以外はフィルタとして演算子だけを残す）
+_SHAPE_PARAMS = ("select", "order", "limit", "offset", "on_conflict", "columns")
+
+
+def query_shape(url) -> str:
+    """URL からユーザーごとの値を除いた「クエリの形」を返す
+
+    例: /rest/v1/progress_logs?select=log_date,completion_hour&user_id=eq.*&order=log_date.desc&limit=30
+    """
+    parts = urlsplit(str(url))
+    params = []
+    for name, value in parse_qsl(parts.query, keep_blank_values=True):
+        if name not in _SHAPE_PARAMS:
+            operator, _, _ = value.partition(".")
+            value = f"{operator}.*"
+        params.append(f"{name}={value}")
+    return f"{parts.path}?{'&'.join(params)}" if params else parts.path
+
+
+class PayloadMetrics:
+    """PostgREST のクエリごとのレスポンスサイズ（転送量と展開後の大きさ）の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # "GET /rest/v1/habits?select=...&user_id=eq.*" -> [回数, 転送バイト数, 展開後バイト数]
+        self._totals = {}
+
+    def on_response(self, response):
+        """httpx の response イベントフック"""
+        response.read()
+        request = response.request
+        key = f"{request.method} {query_shape(request.url)}"
+        self.record(key, response.num_bytes_downloaded, len(response.content))
+
+    def record(self, key: str, wire_bytes: int, decoded_bytes: int):
+        with self._lock:
+            totals = self._totals.setdefault(key, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += wire_bytes
+            totals[2] += decoded_bytes
+
+    def snapshot(self) -> list:
+        """転送量の多い順に、クエリごとの集計を返す"""
+        with self._lock:
+            items = [(key, list(totals)) for key, totals in self._totals.items()]
+
+        return [
+            {
+                "query": key,
+                "requests": count,
+                "wire_bytes": wire,
+                "decoded_bytes": decoded,
+                "compression_ratio": wire / decoded if decoded else 1.0,
+            }
+            for key, (count, wire, decoded) in sorted(items, key=lambda item: item[1][1], reverse=True)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+
+
+def instrument_postgrest(supabase, metrics: PayloadMetrics):
+    """PostgREST の HTTP セッションにサイズ計測のフックを設定する
+
+    レスポンスの圧縮は httpx が Accept-Encoding で要求する
+    （brotli パッケージが入っていれば br も含む）。
+
+    ログイン・トークン更新で PostgREST クライアントは作り直されるため、
+    リランごとに呼んでよい（設定済みなら何もしない）。
+    """
+    session = supabase.postgrest.session
+    hooks = session.event_hooks
+    if metrics.on_response not in hooks["response"]:
+        hooks["response"].append(metrics.on_response)
+        session.event_hooks = hooks
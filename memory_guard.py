@@ -0,0 +1,135 @@
+"""セッションごとのメモリ使用量の計測と、履歴画面のソークテスト
+
+    python memory_guard.py --renders 2000 --budget-kb 2048
+
+履歴画面の描画（キャッシュ経由の読み込み・ヒートマップ集計・グラフ作成）を
+繰り返し、tracemalloc で計測したメモリ増加量が予算を超えたら終了コード1で終わる。
+"""
+import argparse
+import gc
+import io
+import sys
+import tracemalloc
+
+from charts import build_progress_figure, progress_dataframe
+from cached_data_manager import CachedDataManager
+from change_notifier import ChangeNotifier
+from history_stats import build_calendar_heatmap
+from simulator import WorkloadSimulator
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """obj から辿れるオブジェクトの合計サイズ（バイト）の概算"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def session_memory_report(session_state) -> dict:
+    """session_state のキーごとのサイズと、データキャッシュの件数・サイズ"""
+    keys = {str(key): deep_sizeof(session_state[key]) for key in list(session_state.keys())}
+    cache = session_state.get("dm_cache") or {}
+
+    return {
+        "total_bytes": sum(keys.values()),
+        "keys": dict(sorted(keys.items(), key=lambda item: item[1], reverse=True)),
+        "dm_cache_entries": len(cache),
+        "dm_cache_bytes": keys.get("dm_cache", 0),
+    }
+
+
+def _render_history_page(dm, user_id: str, chart: bool):
+    """Streamlit を使わずに履歴画面と同じ処理を行う"""
+    dm.load_history_summary(user_id)
+    history = dm.load_history(user_id)
+    build_calendar_heatmap(history)
+
+    if chart and history:
+        record = history[0]
+        fig = build_progress_figure(progress_dataframe(record.log_summary, record.total_days))
+        # st.pyplot と同様に画像に書き出してから破棄する
+        fig.savefig(io.BytesIO(), format="png")
+        fig.clear()
+
+
+def run_history_soak(renders: int, chart_every: int = 20, live_sessions: int = 20, years: float = 3, seed: int = 0) -> dict:
+    """履歴画面を renders 回描画し、ウォームアップ後からのメモリ増加量を返す
+
+    グラフの作成は重いため、chart_every 回に1回だけ行う。
+
+    セッションは live_sessions 個を順番に入れ替え、終了したセッションの
+    キャッシュは破棄する（実際のサーバーと同じく、セッションごとに
+    キャッシュを持つ）。
+    """
+    simulator = WorkloadSimulator(users=1, days=int(years * 365), seed=seed)
+    simulator.run()
+    user_id = simulator.users[0]
+    notifier = ChangeNotifier()
+
+    sessions = [{} for _ in range(live_sessions)]
+    warmup = max(renders // 10, live_sessions)
+
+    tracemalloc.start()
+    baseline = None
+    try:
+        for i in range(warmup + renders):
+            if i == warmup:
+                # matplotlib の図は循環参照を含むため、回収してから計測する
+                gc.collect()
+                baseline = tracemalloc.get_traced_memory()[0]
+
+            slot = i % live_sessions
+            if i % (live_sessions * 5) == slot:
+                # セッションの終了と新規セッションの開始
+                sessions[slot] = {}
+
+            dm = CachedDataManager(simulator.data_manager, notifier, sessions[slot])
+            _render_history_page(dm, user_id, i % chart_every == 0)
+
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "renders": renders,
+        "history_records": len(simulator.data_manager.load_history(user_id)),
+        "growth_bytes": current - baseline,
+        "peak_bytes": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="履歴画面のメモリソークテスト")
+    parser.add_argument("--renders", type=int, default=2000, help="描画回数")
+    parser.add_argument("--chart-every", type=int, default=20, help="グラフを作成する間隔（描画回数）")
+    parser.add_argument("--budget-kb", type=int, default=2048, help="許容するメモリ増加量 (KB)")
+    args = parser.parse_args()
+
+    result = run_history_soak(args.renders, args.chart_every)
+    growth_kb = result["growth_bytes"] / 1024
+
+    print(f"renders: {result['renders']}  history records: {result['history_records']}")
+    print(f"growth: {growth_kb:.1f} KB  peak: {result['peak_bytes'] / 1024:.1f} KB  budget: {args.budget_kb} KB")
+
+    if growth_kb > args.budget_kb:
+        print("FAILED: メモリ使用量が予算を超えて増加しました", file=sys.stderr)
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
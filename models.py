@@ -0,0 +1,125 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+from constants import DATE_FORMAT, HOURS_PER_DAY
+
+TIME_FORMAT = "%H:%M"
+
+
+def parse_time(value) -> datetime.time:
+    """"HH:MM" / "HH:MM:SS" 形式の文字列を time に変換する"""
+    if isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(str(value))
+
+
+def parse_date(value) -> datetime.date:
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, DATE_FORMAT).date()
+
+
+def parse_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+@dataclass(slots=True, frozen=True)
+class Habit:
+    """habits テーブルの1行"""
+    user_id: str
+    name: str
+    target_time: datetime.time
+    active: bool = True
+
+    @classmethod
+    def from_row(cls, row: dict) -> "Habit":
+        return cls(
+            user_id=row["user_id"],
+            name=row.get("name") or "",
+            target_time=parse_time(row["target_time"]),
+            active=bool(row.get("active", True)),
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class ProgressLog:
+    """progress_logs テーブルの1行（1日分の達成記録）"""
+    log_date: datetime.date
+    completion_hour: int
+
+    @classmethod
+    def from_row(cls, row: dict) -> "ProgressLog":
+        return cls(
+            log_date=parse_date(row["log_date"]),
+            completion_hour=int(row["completion_hour"]),
+        )
+
+    def to_row(self) -> dict:
+        return {
+            "log_date": self.log_date.strftime(DATE_FORMAT),
+            "completion_hour": self.completion_hour,
+        }
+
+
+@dataclass(slots=True, frozen=True)
+class HistoryRecord:
+    """habit_history テーブルの1行（完了したチャレンジ）"""
+    user_id: str
+    habit_name: str
+    target_time: datetime.time
+    archived_at: datetime.datetime
+    total_days: int
+    log_summary: tuple
+    id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> "HistoryRecord":
+        return cls(
+            user_id=row["user_id"],
+            habit_name=row["habit_name"],
+            target_time=parse_time(row["target_time"]),
+            archived_at=parse_datetime(row["archived_at"]),
+            total_days=int(row.get("total_days") or 0),
+            log_summary=tuple(ProgressLog.from_row(log) for log in row.get("log_summary") or []),
+            id=row.get("id"),
+        )
+
+    def to_row(self) -> dict:
+        row = {
+            "user_id": self.user_id,
+            "habit_name": self.habit_name,
+            "target_time": self.target_time.strftime(TIME_FORMAT),
+            "archived_at": self.archived_at.isoformat(),
+            "total_days": self.total_days,
+            "log_summary": [log.to_row() for log in self.log_summary],
+        }
+        if self.id is not None:
+            row["id"] = self.id
+        return row
+
+
+@dataclass(slots=True, frozen=True)
+class HistorySummary:
+    """habit_history_summary テーブルの1行"""
+    user_id: str
+    total_habits: int
+    total_days: int
+    best_streak: int
+    hour_histogram: tuple
+
+    @classmethod
+    def empty(cls, user_id: str) -> "HistorySummary":
+        return cls(user_id=user_id, total_habits=0, total_days=0, best_streak=0, hour_histogram=(0,) * HOURS_PER_DAY)
+
+    @classmethod
+    def from_row(cls, row: dict) -> "HistorySummary":
+        return cls(
+            user_id=row["user_id"],
+            total_habits=int(row["total_habits"]),
+            total_days=int(row["total_days"]),
+            best_streak=int(row["best_streak"]),
+            hour_histogram=tuple(row["hour_histogram"]),
+        )
@@ -0,0 +1,138 @@
+import collections
+import datetime
+import threading
+
+from supabase import Client
+
+from clock import SystemClock
+from constants import NOTIFICATION_DEDUP_TTL_SECONDS
+
+
+def notification_key(user_id: str, habit_name: str, event: str, day: datetime.date) -> str:
+    """通知の冪等キー（同じユーザー・習慣・イベント・日付の通知は1回だけ送る）"""
+    return f"{user_id}:{habit_name}:{event}:{day.isoformat()}"
+
+
+class SupabaseDedupStore:
+    """notification_dedup テーブルで冪等キーを管理する（全セッション・全プロセスで共有）"""
+
+    def __init__(self, supabase: Client):
+        self.supabase = supabase
+
+    def claim(self, key: str, user_id: str, ttl_seconds: int) -> bool:
+        try:
+            res = (
+                self.supabase
+                .rpc("claim_notification", {"p_key": key, "p_user_id": user_id, "p_ttl_seconds": ttl_seconds})
+                .execute()
+            )
+            return res is not None and hasattr(res, 'data') and bool(res.data)
+        except Exception as e:
+            print(f"Error claiming notification: {e}")
+            return False
+
+    def release(self, key: str, user_id: str):
+        """送信できなかった通知のキーを解放し、次の機会に再送できるようにする"""
+        try:
+            self.supabase.rpc("release_notification", {"p_key": key, "p_user_id": user_id}).execute()
+        except Exception as e:
+            print(f"Error releasing notification: {e}")
+
+
+class LocalDedupStore:
+    """プロセス内で冪等キーを管理する（テスト・シミュレーション用）"""
+
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self._lock = threading.Lock()
+        self._expires_at = {}
+
+    def claim(self, key: str, user_id: str, ttl_seconds: int) -> bool:
+        now = self.clock.now()
+        with self._lock:
+            expires_at = self._expires_at.get(key)
+            if expires_at is not None and expires_at >= now:
+                return False
+            self._expires_at[key] = now + datetime.timedelta(seconds=ttl_seconds)
+            return True
+
+    def release(self, key: str, user_id: str):
+        with self._lock:
+            self._expires_at.pop(key, None)
+
+
+class RateLimiter:
+    """ユーザーごとに一定時間内の送信数を制限する（スライディングウィンドウ）"""
+
+    def __init__(self, limit: int, window_seconds: int, clock=None):
+        self.limit = limit
+        self.window = datetime.timedelta(seconds=window_seconds)
+        self.clock = clock or SystemClock()
+        self._lock = threading.Lock()
+        self._sent = collections.defaultdict(collections.deque)
+
+    def available(self, user_id: str) -> bool:
+        """送信枠が残っているか（枠は消費しない）"""
+        now = self.clock.now()
+        with self._lock:
+            return len(self._expire(user_id, now)) < self.limit
+
+    def allow(self, user_id: str) -> bool:
+        """送信枠が残っていれば1つ消費して True を返す"""
+        now = self.clock.now()
+        with self._lock:
+            sent = self._expire(user_id, now)
+            if len(sent) >= self.limit:
+                return False
+            sent.append(now)
+            return True
+
+    def _expire(self, user_id: str, now: datetime.datetime):
+        # ロックを取得した状態で呼ぶ
+        sent = self._sent[user_id]
+        while sent and sent[0] <= now - self.window:
+            sent.popleft()
+        return sent
+
+
+class NotificationDispatcher:
+    """冪等キーとレート制限を通して通知を送る
+
+    send は send(message, user_id) -> bool の形の実際の送信関数。
+    """
+
+    def __init__(self, store, send, rate_limiter: RateLimiter, clock=None):
+        self.store = store
+        self.send = send
+        self.rate_limiter = rate_limiter
+        self.clock = clock or SystemClock()
+
+    def dispatch(self, user_id: str, habit_name: str, event: str, message: str) -> bool:
+        """通知を送信する。重複・レート制限・送信失敗で送れなかった場合は False を返す
+
+        冪等キーは実際に送信できた場合だけ残す。レート制限や送信失敗の
+        通知はキーを確保しない（または解放する）ため、次の機会に再送される。
+        失敗した送信も送信枠は消費する（失敗が続くときの再送を抑える）。
+        """
+        key = notification_key(user_id, habit_name, event, self.clock.today())
+
+        if not self.rate_limiter.available(user_id):
+            print(f"Notification rate limited: {key}")
+            return False
+
+        if not self.store.claim(key, user_id, NOTIFICATION_DEDUP_TTL_SECONDS):
+            return False
+
+        if not self.rate_limiter.allow(user_id):
+            # 確認後に他のセッションが枠を使い切った
+            self.store.release(key, user_id)
+            print(f"Notification rate limited: {key}")
+            return False
+
+        sent = False
+        try:
+            sent = self.send(message, user_id)
+        finally:
+            if not sent:
+                self.store.release(key, user_id)
+        return sent
@@ -0,0 +1,152 @@
+import collections
+import datetime
+import os
+import sys
+import threading
+import time
+
+PROFILE_ENV = "HABIT_TRACKER_PROFILE"  # "1" で全リランを計測対象にする
+PROFILE_ADMINS_ENV = "HABIT_TRACKER_PROFILE_ADMINS"  # 計測を許可するメールアドレス（カンマ区切り）
+PROFILE_QUERY_PARAM = "profile"
+
+# 時間の集計区分（スタックの内側から見て最初に一致したものに割り当てる）
+CATEGORY_CHART = "chart"
+CATEGORY_DATA = "data_manager"
+CATEGORY_RENDER = "render"
+CATEGORY_OTHER = "other"
+
+_DATA_MANAGER_FILES = ("data_manager_supabase.py", "data_manager_local.py", "cached_data_manager.py")
+
+
+def is_profile_admin(user) -> bool:
+    """計測を許可されたユーザーか"""
+    email = getattr(user, "email", None)
+    if not email:
+        return False
+    admins = {a.strip() for a in os.environ.get(PROFILE_ADMINS_ENV, "").split(",") if a.strip()}
+    return email in admins
+
+
+def should_profile_rerun(query_params, user) -> bool:
+    """このリランを計測するか（クエリパラメータまたは環境変数で指定し、管理者のみ有効）"""
+    requested = (
+        query_params.get(PROFILE_QUERY_PARAM) == "1"
+        or os.environ.get(PROFILE_ENV) == "1"
+    )
+    return requested and is_profile_admin(user)
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _categorize(code) -> str:
+    filename = os.path.basename(code.co_filename)
+    if code.co_name == "render_progress_chart" or f"{os.sep}matplotlib{os.sep}" in code.co_filename:
+        return CATEGORY_CHART
+    if filename in _DATA_MANAGER_FILES:
+        return CATEGORY_DATA
+    if code.co_name.startswith("render_"):
+        return CATEGORY_RENDER
+    return None
+
+
+class SamplingProfiler:
+    """対象スレッドのスタックを一定間隔で採取するプロファイラ
+
+    採取結果は flamegraph.pl / speedscope で読める collapsed stack 形式で出力できる。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.categories = collections.Counter()
+        self._target_thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """呼び出し元のスレッドの計測を開始する"""
+        self._target_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="rerun-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _record(self, frame):
+        labels = []
+        category = None
+        while frame is not None:
+            code = frame.f_code
+            labels.append(_frame_label(code))
+            if category is None:
+                category = _categorize(code)
+            frame = frame.f_back
+
+        labels.reverse()
+        self.stacks[";".join(labels)] += 1
+        self.categories[category or CATEGORY_OTHER] += 1
+
+    def category_seconds(self, elapsed: float) -> dict:
+        """経過時間 elapsed をサンプル数の比率で区分ごとに按分する"""
+        total = sum(self.categories.values())
+        if not total:
+            return {}
+        return {name: elapsed * count / total for name, count in self.categories.most_common()}
+
+    def write_collapsed(self, path: str):
+        """collapsed stack 形式（"a;b;c 回数"）で書き出す"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_rerun(run, output_dir: str, keep: int = None) -> dict:
+    """run() を1回計測し、collapsed stack ファイルのパスと区分別の時間を返す
+
+    st.rerun() などで run() が例外を送出した場合も計測結果は書き出す。
+    keep を指定すると、output_dir には新しいものから keep 件だけ残す。
+    """
+    profiler = SamplingProfiler()
+    result = {}
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        run()
+    finally:
+        profiler.stop()
+        os.makedirs(output_dir, exist_ok=True)
+        filename = datetime.datetime.now().strftime("rerun-%Y%m%d-%H%M%S-%f.folded")
+        path = os.path.join(output_dir, filename)
+        profiler.write_collapsed(path)
+        if keep is not None:
+            _prune_profiles(output_dir, keep)
+
+        elapsed = time.perf_counter() - started
+        result = {
+            "path": path,
+            "elapsed": elapsed,
+            "categories": profiler.category_seconds(elapsed),
+        }
+
+    return result
+
+
+def _prune_profiles(output_dir: str, keep: int):
+    """古い計測結果を削除する（ファイル名に日時を含むため名前順で判定する）"""
+    files = sorted(name for name in os.listdir(output_dir) if name.startswith("rerun-") and name.endswith(".folded"))
+    for name in files[:-keep] if keep else files:
+        try:
+            os.remove(os.path.join(output_dir, name))
+        except OSError as e:
+            print(f"Error removing old profile: {e}")
@@ -0,0 +1,155 @@
+"""HabitTracker の長期ワークロードシミュレーター
+
+SimulatedClock と DataManagerLocal を使い、複数ユーザーの数年分の操作
+（記録・記録忘れ・取り消し・リセット・チャレンジ完了）を高速に再生する。
+処理性能と最終的なデータ量の分布を出力し、生成したデータは
+他の性能計測の入力としても使える。
+
+    python simulator.py --users 100 --years 3 --seed 1
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+
+from clock import SimulatedClock
+from constants import MAX_CHALLENGE_DAYS
+from data_manager_local import DataManagerLocal
+from habit_tracker import HabitTracker
+
+HABIT_NAMES = ["朝5分ストレッチ", "参考書を3ページ読む", "机の上を整理する", "水を1杯飲む", "深呼吸3回"]
+
+
+class WorkloadSimulator:
+    """ユーザーごとの1日の行動を乱数で決めて HabitTracker に流し込む"""
+
+    def __init__(
+        self,
+        users: int,
+        days: int,
+        seed: int = 0,
+        click_rate: float = 0.85,
+        undo_rate: float = 0.02,
+        start: datetime.date = datetime.date(2024, 1, 1),
+    ):
+        self.users = [f"user-{i:05d}" for i in range(users)]
+        self.days = days
+        self.click_rate = click_rate
+        self.undo_rate = undo_rate
+        self.random = random.Random(seed)
+        self.clock = SimulatedClock(datetime.datetime.combine(start, datetime.time()))
+        self.data_manager = DataManagerLocal()
+        self.tracker = HabitTracker(self.data_manager, self.clock)
+        self.events = {"click": 0, "miss": 0, "undo": 0, "reset": 0, "complete": 0}
+
+    def run(self) -> dict:
+        """全期間を再生し、結果のレポートを返す"""
+        start_day = self.clock.now()
+        for user_id in self.users:
+            self._start_habit(user_id)
+
+        started = time.perf_counter()
+        for day in range(self.days):
+            for user_id in self.users:
+                self._simulate_user_day(user_id, start_day + datetime.timedelta(days=day))
+        elapsed = time.perf_counter() - started
+
+        return self.report(elapsed)
+
+    def _start_habit(self, user_id: str):
+        hour = self.random.randrange(5, 23)
+        self.data_manager.save_user_habit(user_id, self.random.choice(HABIT_NAMES), f"{hour:02d}:00")
+
+    def _simulate_user_day(self, user_id: str, day: datetime.datetime):
+        tracker = self.tracker
+        habit = self.data_manager.load_user_habit(user_id)
+        self.clock.set(day.replace(hour=habit.target_time.hour))
+
+        # チャレンジ画面を開いたときと同じ判定
+        logs = tracker.get_logs(user_id, limit=MAX_CHALLENGE_DAYS)
+        count, last_date = tracker.get_click_status(logs)
+        if tracker.needs_reset(count, last_date):
+            tracker.reset_logs(user_id)
+            self.events["reset"] += 1
+            logs, count, last_date = [], 0, None
+
+        if tracker.is_completed(count):
+            tracker.complete_challenge(user_id, habit.name, habit.target_time, logs)
+            self._start_habit(user_id)
+            self.events["complete"] += 1
+            return
+
+        if self.random.random() >= self.click_rate:
+            self.events["miss"] += 1
+            return
+
+        # 目標時刻の前後にばらつかせて記録する
+        offset = self.random.randint(-3, 3)
+        self.clock.set(day.replace(hour=min(max(habit.target_time.hour + offset, 0), 23)))
+        if tracker.can_click_today(last_date):
+            tracker.record_today(user_id)
+            self.events["click"] += 1
+
+            if self.random.random() < self.undo_rate:
+                tracker.delete_today_log(user_id)
+                self.events["undo"] += 1
+
+    def report(self, elapsed: float) -> dict:
+        """処理性能とユーザーごとのデータ量の分布"""
+        dm = self.data_manager
+        log_counts = [dm.count_click_logs(u) for u in self.users]
+        history_counts = [len(dm.load_history(u)) for u in self.users]
+        user_days = len(self.users) * self.days
+
+        return {
+            "users": len(self.users),
+            "days": self.days,
+            "elapsed_seconds": elapsed,
+            "user_days_per_second": user_days / elapsed if elapsed else 0.0,
+            "events": dict(self.events),
+            "progress_logs_per_user": _distribution(log_counts),
+            "history_records_per_user": _distribution(history_counts),
+        }
+
+
+def _distribution(values: list) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p90": ordered[int(len(ordered) * 0.9) if len(ordered) > 1 else 0],
+        "max": ordered[-1],
+        "total": sum(ordered),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HabitTracker の長期ワークロードシミュレーター")
+    parser.add_argument("--users", type=int, default=100, help="ユーザー数")
+    parser.add_argument("--years", type=float, default=3, help="シミュレーションする年数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--click-rate", type=float, default=0.85, help="1日に記録する確率")
+    parser.add_argument("--undo-rate", type=float, default=0.02, help="記録を取り消す確率")
+    args = parser.parse_args()
+
+    simulator = WorkloadSimulator(
+        users=args.users,
+        days=int(args.years * 365),
+        seed=args.seed,
+        click_rate=args.click_rate,
+        undo_rate=args.undo_rate,
+    )
+    report = simulator.run()
+
+    print(f"users: {report['users']}  days: {report['days']}")
+    print(f"elapsed: {report['elapsed_seconds']:.2f}s  ({report['user_days_per_second']:.0f} user-days/s)")
+    print(f"events: {report['events']}")
+    print(f"progress_logs per user: {report['progress_logs_per_user']}")
+    print(f"history records per user: {report['history_records_per_user']}")
+
+
+if __name__ == "__main__":
+    main()
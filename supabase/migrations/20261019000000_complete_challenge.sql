@@ -0,0 +1,20 @@
+-- チャレンジ完了処理（履歴保存・ログリセット・習慣の無効化）を1トランザクションで行う
+create or replace function public.complete_challenge(p_user_id uuid, p_record jsonb)
+returns boolean
+language plpgsql
+security invoker
+as $$
+begin
+  insert into public.habit_history (user_id, habit_name, target_time, archived_at, total_days, log_summary)
+  select p_user_id, r.habit_name, r.target_time, coalesce(r.archived_at, now()), r.total_days, r.log_summary
+  from jsonb_populate_record(null::public.habit_history, p_record) as r;
+
+  delete from public.progress_logs where user_id = p_user_id;
+
+  update public.habits set active = false where user_id = p_user_id;
+
+  return true;
+end;
+$$;
+
+grant execute on function public.complete_challenge(uuid, jsonb) to authenticated;
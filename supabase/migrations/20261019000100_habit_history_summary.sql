@@ -0,0 +1,89 @@
+-- ユーザーごとの履歴集計（履歴画面のヘッダー用）
+-- habit_history への INSERT と同じトランザクション内でトリガーにより更新する
+create table if not exists public.habit_history_summary (
+  user_id uuid primary key references auth.users (id) on delete cascade,
+  total_habits integer not null default 0,
+  total_days integer not null default 0,
+  best_streak integer not null default 0,
+  -- 習慣ごとの平均達成時刻（0〜23時）のヒストグラム
+  hour_histogram integer[] not null default array_fill(0, array[24]),
+  updated_at timestamptz not null default now()
+);
+
+alter table public.habit_history_summary enable row level security;
+
+create policy "Users can view own history summary"
+  on public.habit_history_summary for select
+  using (auth.uid() = user_id);
+
+create or replace function public.apply_habit_history_summary()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_avg_hour numeric;
+  v_bucket integer;
+begin
+  select avg((e ->> 'completion_hour')::numeric)
+    into v_avg_hour
+    from jsonb_array_elements(coalesce(new.log_summary::jsonb, '[]'::jsonb)) as e;
+
+  insert into public.habit_history_summary (user_id)
+  values (new.user_id)
+  on conflict (user_id) do nothing;
+
+  update public.habit_history_summary
+     set total_habits = total_habits + 1,
+         total_days = total_days + coalesce(new.total_days, 0),
+         best_streak = greatest(best_streak, coalesce(new.total_days, 0)),
+         updated_at = now()
+   where user_id = new.user_id;
+
+  if v_avg_hour is not null then
+    v_bucket := least(greatest(floor(v_avg_hour)::integer, 0), 23) + 1;
+    update public.habit_history_summary
+       set hour_histogram[v_bucket] = hour_histogram[v_bucket] + 1
+     where user_id = new.user_id;
+  end if;
+
+  return new;
+end;
+$$;
+
+drop trigger if exists habit_history_summary_on_insert on public.habit_history;
+create trigger habit_history_summary_on_insert
+  after insert on public.habit_history
+  for each row execute function public.apply_habit_history_summary();
+
+-- 既存の履歴から集計を作成する
+insert into public.habit_history_summary (user_id, total_habits, total_days, best_streak, hour_histogram)
+select
+  h.user_id,
+  count(*),
+  coalesce(sum(h.total_days), 0),
+  coalesce(max(h.total_days), 0),
+  (
+    select array_agg(coalesce(b.cnt, 0) order by g.hour)
+      from generate_series(0, 23) as g(hour)
+      left join (
+        select least(greatest(floor(a.avg_hour)::integer, 0), 23) as hour, count(*) as cnt
+          from (
+            select (select avg((e ->> 'completion_hour')::numeric)
+                      from jsonb_array_elements(coalesce(h2.log_summary::jsonb, '[]'::jsonb)) as e) as avg_hour
+              from public.habit_history h2
+             where h2.user_id = h.user_id
+          ) as a
+         where a.avg_hour is not null
+         group by 1
+      ) as b on b.hour = g.hour
+  )
+from public.habit_history h
+group by h.user_id
+on conflict (user_id) do update
+  set total_habits = excluded.total_habits,
+      total_days = excluded.total_days,
+      best_streak = excluded.best_streak,
+      hour_histogram = excluded.hour_histogram,
+      updated_at = now();
@@ -0,0 +1,7 @@
+-- キャッシュ無効化のため、習慣関連テーブルの変更を Realtime で配信する
+-- DELETE 時にも user_id を受け取れるよう、行全体を WAL に残す
+alter table public.habits replica identity full;
+alter table public.progress_logs replica identity full;
+alter table public.habit_history replica identity full;
+
+alter publication supabase_realtime add table public.habits, public.progress_logs, public.habit_history;
@@ -0,0 +1,38 @@
+-- 通知の重複送信を防ぐための冪等キー
+create table if not exists public.notification_dedup (
+  key text primary key,
+  user_id uuid not null references auth.users (id) on delete cascade,
+  expires_at timestamptz not null
+);
+
+create index if not exists notification_dedup_expires_at_idx
+  on public.notification_dedup (expires_at);
+
+alter table public.notification_dedup enable row level security;
+
+-- キーを確保できた（未送信または期限切れだった）場合のみ true を返す
+create or replace function public.claim_notification(p_key text, p_user_id uuid, p_ttl_seconds integer)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed boolean;
+begin
+  if p_user_id is distinct from auth.uid() then
+    raise exception 'cannot claim notifications for another user';
+  end if;
+
+  insert into public.notification_dedup (key, user_id, expires_at)
+  values (p_key, p_user_id, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (key) do update
+    set expires_at = excluded.expires_at
+    where notification_dedup.expires_at < now()
+  returning true into v_claimed;
+
+  return coalesce(v_claimed, false);
+end;
+$$;
+
+grant execute on function public.claim_notification(text, uuid, integer) to authenticated;
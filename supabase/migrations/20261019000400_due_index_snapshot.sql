@@ -0,0 +1,13 @@
+-- 「今日の記録が必要なユーザー」索引を起動時に1回のクエリで構築するためのスナップショット
+create or replace function public.due_index_snapshot()
+returns table (user_id uuid, target_time time, last_log_date date)
+language sql
+stable
+security invoker
+as $$
+  select h.user_id, h.target_time::time, max(p.log_date)
+    from public.habits h
+    left join public.progress_logs p on p.user_id = h.user_id
+   where h.active
+   group by h.user_id, h.target_time;
+$$;
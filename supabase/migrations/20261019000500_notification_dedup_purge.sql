@@ -0,0 +1,49 @@
+-- 期限切れの冪等キーを削除し、送信に失敗した通知のキーを解放できるようにする
+
+-- キーを確保するたびに期限切れの行を削除する（expires_at の索引を使う）
+create or replace function public.claim_notification(p_key text, p_user_id uuid, p_ttl_seconds integer)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_claimed boolean;
+begin
+  if p_user_id is distinct from auth.uid() then
+    raise exception 'cannot claim notifications for another user';
+  end if;
+
+  delete from public.notification_dedup
+  where expires_at < now();
+
+  insert into public.notification_dedup (key, user_id, expires_at)
+  values (p_key, p_user_id, now() + make_interval(secs => p_ttl_seconds))
+  on conflict (key) do update
+    set expires_at = excluded.expires_at
+    where notification_dedup.expires_at < now()
+  returning true into v_claimed;
+
+  return coalesce(v_claimed, false);
+end;
+$$;
+
+-- 送信できなかった通知のキーを解放する
+create or replace function public.release_notification(p_key text, p_user_id uuid)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if p_user_id is distinct from auth.uid() then
+    raise exception 'cannot release notifications for another user';
+  end if;
+
+  delete from public.notification_dedup
+  where key = p_key
+    and user_id = p_user_id;
+end;
+$$;
+
+grant execute on function public.release_notification(text, uuid) to authenticated;
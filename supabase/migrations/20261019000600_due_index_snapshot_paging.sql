@@ -0,0 +1,18 @@
+-- max_rows（1000行）で切られないよう、スナップショットを user_id のキーセットでページングする
+drop function if exists public.due_index_snapshot();
+
+create or replace function public.due_index_snapshot(p_after uuid default null, p_limit integer default 1000)
+returns table (user_id uuid, target_time time, last_log_date date)
+language sql
+stable
+security invoker
+as $$
+  select h.user_id, h.target_time::time, max(p.log_date)
+    from public.habits h
+    left join public.progress_logs p on p.user_id = h.user_id
+   where h.active
+     and (p_after is null or h.user_id > p_after)
+   group by h.user_id, h.target_time
+   order by h.user_id
+   limit p_limit;
+$$;